@@ -4,8 +4,8 @@ from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
-from flask.logging import create_logger
 from flask_bootstrap import Bootstrap5
+from flask_security import Security, SQLAlchemyUserDatastore
 from flask_security.models import fsqla_v3 as fsqla
 from flask_mailman import Mail
 from flask_compress import Compress
@@ -15,33 +15,71 @@ logging.basicConfig(filename='logfile.log', level=logging.ERROR, format=f'%(asct
 logw = logging.getLogger('werkzeug')
 logw.setLevel(logging.ERROR)
 
-# Create app
-app = Flask(__name__)
-log = create_logger(app)
-app.config.from_object(Config)
-
-# Initialize Flask-Compress
+# Extensions, bound to an application by create_app
+db = SQLAlchemy()
 compress = Compress()
-compress.init_app(app)
-
-bootstrap = Bootstrap5(app)
-
-# Create database connection object
-db = SQLAlchemy(app)
-
-mail = Mail(app)
+bootstrap = Bootstrap5()
+mail = Mail()
+bcrypt = Bcrypt()
+migrate = Migrate()
+security = Security()
 
 # Define models
 fsqla.FsModels.set_db_info(db)
 
-bcrypt = Bcrypt(app)
-migrate = Migrate(app, db)
 
-from app import models, reagent, user, location, department, errors, calibration
-from app.models import User
-
-@app.route("/")
-@app.route("/index")
 def index():
     """index"""
     return render_template("index.html")
+
+
+def create_app(config=Config):
+    """build an application
+
+    config: object with the configuration, see config.py.sample
+    Importing the blueprints here (not at module level) keeps the import of
+    this package cheap, and the application can be created once in the
+    gunicorn master with --preload and shared by the forked workers.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    db.init_app(app)
+    compress.init_app(app)
+    bootstrap.init_app(app)
+    mail.init_app(app)
+    bcrypt.init_app(app)
+    migrate.init_app(app, db)
+
+    from app import models, versions, audit, search, consumption, commands, assets, fragments, archive, partitions, benchmark, diagnostics, metrics
+    from app import reagent, calibration, user, location, department, errors
+
+    app.security = security
+    security.init_app(app, SQLAlchemyUserDatastore(db, models.User, models.Role))
+
+    for blueprint in (reagent.bp, calibration.bp, user.bp, location.bp, department.bp, errors.bp, assets.bp):
+        app.register_blueprint(blueprint)
+    app.add_url_rule("/", "index", index)
+    app.add_url_rule("/index", "index", index)
+    app.add_template_global(assets.asset_url)
+    app.add_template_global(fragments.render_rows)
+
+    # registered first, its after_request runs last and counts the audit writes
+    diagnostics.init_app(app)
+    metrics.init_app(app)
+    app.after_request(audit.write_at_request_end)
+
+    for command in (
+        commands.init_db_command,
+        commands.seed_roles_command,
+        commands.seed_demo_users_command,
+        search.reindex_search_command,
+        consumption.rebuild_consumption_command,
+        assets.build_assets_command,
+        archive.archive_logs_command,
+        partitions.log_partitions_command,
+        benchmark.benchmark_command,
+    ):
+        app.cli.add_command(command)
+
+    return app
@@ -0,0 +1,353 @@
+import io
+import json
+import os
+from collections import deque
+from datetime import date, datetime, timedelta
+from itertools import islice
+from types import SimpleNamespace
+
+import click
+from dateutil.relativedelta import relativedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select
+
+from app import db
+from app.models import Applog, Calibrations, CalibrationsLog, Departments, Inventory, Locations, User
+
+# Log retention: rows of applog and calibrationlog older than
+# LOG_RETENTION_DAYS are moved, a whole month at a time, to compressed
+# segment files in LOG_ARCHIVE_DIR:
+#   applog/2024-03.jsonl.zst    one json object per row, oldest first
+#   applog/2024-03.1.jsonl.zst  rows of the month logged after it was archived
+#   applog/index.json           rows, min/max event_time and id of each segment
+# The rows keep the names of their reagent, calibration and user as they
+# were, the archive does not depend on the current tables.
+# Run daily, from cron or a systemd timer:
+#   flask archive-logs
+# The log views (app.logs) read the segments after the rows of the table,
+# when a page reaches back past them.
+#
+# Neither side holds a segment in memory: the archiver streams the rows of
+# a month from the database into the compressor, ARCHIVE_BATCH_SIZE at a
+# time, and readers decode a segment line by line, on every use, stopping
+# at the cursor of the page. Only the small index is read whole.
+
+LOG_RETENTION_DAYS = 365
+ARCHIVE_BATCH_SIZE = 1000
+INDEX = "index.json"
+SUFFIX = ".jsonl.zst"
+
+# a segment is "pending" from the moment its file is written until the rows
+# are deleted from the table, readers only use "done" segments
+PENDING = "pending"
+DONE = "done"
+
+
+def _archive_select(model):
+    """the columns of an archived row, with the names it shows"""
+    if model is Applog:
+        return (
+            select(
+                Applog.id,
+                Applog.event_time,
+                Applog.user_id,
+                User.username,
+                Applog.product_id,
+                Inventory.name.label("product_name"),
+                Locations.name.label("location_name"),
+                Applog.event_type,
+                Applog.quantity_delta,
+                Applog.field_name,
+                Applog.old_value,
+                Applog.new_value,
+                Applog.event_detail,
+            )
+            .outerjoin(User, Applog.user_id == User.id)
+            .outerjoin(Inventory, Applog.product_id == Inventory.id)
+            .outerjoin(Locations, Inventory.location_id == Locations.id)
+        )
+    return (
+        select(
+            CalibrationsLog.id,
+            CalibrationsLog.event_time,
+            CalibrationsLog.user_id,
+            User.username,
+            CalibrationsLog.calibration_id,
+            Calibrations.name.label("calibration_name"),
+            Calibrations.apparatus,
+            Calibrations.description,
+            Departments.name.label("department_name"),
+            CalibrationsLog.event_detail,
+        )
+        .outerjoin(User, CalibrationsLog.user_id == User.id)
+        .outerjoin(Calibrations, CalibrationsLog.calibration_id == Calibrations.id)
+        .outerjoin(Departments, Calibrations.department_id == Departments.id)
+    )
+
+
+def archive_dir(model):
+    root = current_app.config.get("LOG_ARCHIVE_DIR") or os.path.join(
+        current_app.instance_path, "log_archive"
+    )
+    return os.path.join(root, model.__tablename__)
+
+
+def read_index(model):
+    try:
+        with open(os.path.join(archive_dir(model), INDEX)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def _write_index(model, segments):
+    path = os.path.join(archive_dir(model), INDEX)
+    with open(path + ".tmp", "w") as f:
+        json.dump(segments, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _write_segment(path, rows):
+    """write rows (oldest first) to the segment file path; returns the index
+    entry of the segment, None (and no file) without rows"""
+    # only loaded by the archiver and the readers of old logs
+    import zstandard
+
+    segment = None
+    with open(path + ".tmp", "wb") as f:
+        with zstandard.ZstdCompressor(level=10).stream_writer(f, closefd=False) as writer:
+            for row in rows:
+                if segment is None:
+                    segment = {
+                        "file": os.path.basename(path),
+                        "rows": 0,
+                        "min_time": row["event_time"],
+                        "min_id": row["id"],
+                        "max_id": row["id"],
+                    }
+                segment["rows"] += 1
+                segment["max_time"] = row["event_time"]
+                segment["min_id"] = min(segment["min_id"], row["id"])
+                segment["max_id"] = max(segment["max_id"], row["id"])
+                writer.write(json.dumps(row).encode() + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    if segment is None:
+        os.remove(path + ".tmp")
+        return None
+    os.replace(path + ".tmp", path)
+    segment["state"] = PENDING
+    return segment
+
+
+def segment_rows(model, segment):
+    """the rows of a segment, oldest first, decoded as they are read"""
+    import zstandard
+
+    path = os.path.join(archive_dir(model), segment["file"])
+    with open(path, "rb") as f:
+        with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                yield json.loads(line)
+
+
+def _segment_ids(model, segment):
+    """the ids of a segment, ARCHIVE_BATCH_SIZE at a time"""
+    ids = (row["id"] for row in segment_rows(model, segment))
+    while batch := list(islice(ids, ARCHIVE_BATCH_SIZE)):
+        yield batch
+
+
+def archived_rows(model):
+    """the rows of all the archived segments of model, as stored"""
+    for segment in read_index(model):
+        if segment["state"] == DONE:
+            yield from segment_rows(model, segment)
+
+
+def _segment_file(directory, month):
+    name = f"{month}{SUFFIX}"
+    part = 0
+    while os.path.exists(os.path.join(directory, name)):
+        part += 1
+        name = f"{month}.{part}{SUFFIX}"
+    return name
+
+
+def _recover(model, segments):
+    """settle the segments left pending by an interrupted run: done if their
+    rows are gone from the table, removed (archived again later) if not"""
+    for segment in segments:
+        if segment["state"] != PENDING:
+            continue
+        left = any(
+            db.session.scalar(
+                select(func.count()).select_from(model).where(model.id.in_(ids))
+            )
+            for ids in _segment_ids(model, segment)
+        )
+        if left:
+            os.remove(os.path.join(archive_dir(model), segment["file"]))
+            segment["state"] = None
+        else:
+            segment["state"] = DONE
+    segments[:] = [s for s in segments if s["state"] is not None]
+    _write_index(model, segments)
+
+
+def archive_logs(model, retention_days=None):
+    """move the rows of model older than the retention, whole months only,
+    to segment files; returns the number of rows moved"""
+    if retention_days is None:
+        retention_days = current_app.config.get("LOG_RETENTION_DAYS", LOG_RETENTION_DAYS)
+    horizon = date.today() - timedelta(days=retention_days)
+    cutoff = datetime(horizon.year, horizon.month, 1)
+    directory = archive_dir(model)
+    os.makedirs(directory, exist_ok=True)
+    segments = read_index(model)
+    _recover(model, segments)
+
+    oldest = db.session.scalar(select(func.min(model.event_time)).where(model.event_time < cutoff))
+    if oldest is None:
+        return 0
+    moved = 0
+    start = datetime(oldest.year, oldest.month, 1)
+    while start < cutoff:
+        end = start + relativedelta(months=1)
+        result = db.session.execute(
+            _archive_select(model)
+            .where(model.event_time >= start, model.event_time < end)
+            .order_by(model.event_time, model.id)
+            .execution_options(yield_per=ARCHIVE_BATCH_SIZE)
+        )
+        rows = (
+            {**row._mapping, "event_time": row.event_time.isoformat()}
+            for row in result
+        )
+        name = _segment_file(directory, start.strftime("%Y-%m"))
+        segment = _write_segment(os.path.join(directory, name), rows)
+        if segment is not None:
+            segments.append(segment)
+            _write_index(model, segments)
+            # the ids are read back from the file written, not kept in memory
+            try:
+                for ids in _segment_ids(model, segment):
+                    db.session.execute(
+                        delete(model)
+                        .where(model.id.in_(ids))
+                        .execution_options(synchronize_session=False)
+                    )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            segment["state"] = DONE
+            _write_index(model, segments)
+            moved += segment["rows"]
+        start = end
+    return moved
+
+
+def _archived_log(model, row):
+    """an archived row, with the attributes the log templates read"""
+    log = SimpleNamespace(**row)
+    log.event_time = datetime.fromisoformat(row["event_time"])
+    log.user = SimpleNamespace(username=row["username"]) if row["username"] is not None else None
+    if model is Applog:
+        # "archived" keeps its cached rows apart from the live ones, see app.fragments
+        log.product = SimpleNamespace(
+            id=row["product_id"],
+            name=row["product_name"],
+            location=row["location_name"],
+            version="archived",
+        ) if row["product_name"] is not None else None
+    else:
+        log.calibration = SimpleNamespace(
+            id=row["calibration_id"],
+            name=row["calibration_name"],
+            apparatus=row["apparatus"],
+            description=row["description"],
+            department=row["department_name"],
+        ) if row["calibration_name"] is not None else None
+    return log
+
+
+def newest_archived(model):
+    """event_time of the newest archived row, None without archive"""
+    times = [s["max_time"] for s in read_index(model) if s["state"] == DONE]
+    return datetime.fromisoformat(max(times)) if times else None
+
+
+def _matches(model, row, filters, start, end):
+    time = row["event_time"]
+    if start is not None and time < start:
+        return False
+    if end is not None and time >= end:
+        return False
+    if "user" in filters and row["username"] != filters["user"]:
+        return False
+    if "subject" in filters:
+        subject = row["product_id"] if model is Applog else row["calibration_id"]
+        if subject != filters["subject"]:
+            return False
+    if "event_type" in filters and row.get("event_type") != filters["event_type"]:
+        return False
+    return True
+
+
+def archived_logs(model, filters, cursor=None, limit=None):
+    """archived rows matching filters (see app.logs.log_filters), newest
+    first, after cursor (event_time, id); at most limit of them"""
+    start = end = None
+    if "from" in filters:
+        start = datetime.combine(filters["from"], datetime.min.time()).isoformat()
+    if "to" in filters:
+        end = datetime.combine(filters["to"] + timedelta(days=1), datetime.min.time()).isoformat()
+    after = (cursor[0].isoformat(), cursor[1]) if cursor is not None else None
+    segments = sorted(
+        (s for s in read_index(model) if s["state"] == DONE),
+        key=lambda s: s["max_time"],
+        reverse=True,
+    )
+    found = []
+    for segment in segments:
+        # the min/max index skips the segments out of the range
+        if start is not None and segment["max_time"] < start:
+            continue
+        if end is not None and segment["min_time"] >= end:
+            continue
+        if after is not None and segment["min_time"] > after[0]:
+            continue
+        if limit is not None and len(found) >= limit and segment["max_time"] < found[limit - 1][0][0]:
+            break
+        # the rows are oldest first: the newest before the cursor are the
+        # last ones read, and nothing past the cursor or the range is needed
+        newest = deque(maxlen=limit)
+        for row in segment_rows(model, segment):
+            key = (row["event_time"], row["id"])
+            if after is not None and key >= after:
+                break
+            if end is not None and row["event_time"] >= end:
+                break
+            if _matches(model, row, filters, start, end):
+                newest.append((key, row))
+        found.extend(newest)
+        found.sort(key=lambda item: item[0], reverse=True)
+        if limit is not None:
+            del found[limit:]
+    if limit is not None:
+        found = found[:limit]
+    return [_archived_log(model, row) for _, row in found]
+
+
+@click.command("archive-logs")
+@click.option("--days", type=int, default=None, help="Retention in days, LOG_RETENTION_DAYS by default.")
+@with_appcontext
+def archive_logs_command(days):
+    """Move old log rows to compressed monthly segment files."""
+    for model in (Applog, CalibrationsLog):
+        moved = archive_logs(model, days)
+        click.echo(f"archived {moved} {model.__tablename__} rows in {archive_dir(model)}")
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # optional, .br variants are skipped without it
+    brotli = None
+
+# Static files are served from a build directory, written by
+# 'flask build-assets' at deploy time:
+#   static/dist/js/pdfmake.3f2a9c81d0b4.js      content hashed copy
+#   static/dist/js/pdfmake.3f2a9c81d0b4.js.br   brotli variant
+#   static/dist/js/pdfmake.3f2a9c81d0b4.js.gz   gzip variant
+#   static/dist/manifest.json                   js/pdfmake.js -> hashed name
+# A hashed name never changes content, so it is cached by browsers for a
+# year, and the compressed variants are sent as they are instead of being
+# recompressed by Flask-Compress.
+# Without a build, asset_url falls back to the plain static files.
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+COMPRESSIBLE = (".js", ".css", ".svg", ".json", ".txt", ".map")
+MAX_AGE = 365 * 24 * 3600
+
+bp = Blueprint("assets", __name__)
+
+_manifest = {"mtime": None, "files": {}}
+
+
+def _dist_folder():
+    return os.path.join(current_app.static_folder, DIST)
+
+
+def _manifest_files():
+    """the manifest, reloaded when a new build replaces it"""
+    path = os.path.join(_dist_folder(), MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    if mtime != _manifest["mtime"]:
+        with open(path) as f:
+            _manifest["files"] = json.load(f)
+        _manifest["mtime"] = mtime
+    return _manifest["files"]
+
+
+def asset_url(filename):
+    """url of a static file, fingerprinted if the assets were built"""
+    hashed = _manifest_files().get(filename)
+    if hashed is None:
+        return url_for("static", filename=filename)
+    return url_for("assets.dist", filename=hashed)
+
+
+@bp.route("/static/dist/<path:filename>")
+def dist(filename):
+    """serve a built asset, precompressed when the client accepts it"""
+    folder = _dist_folder()
+    accepted = request.accept_encodings
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if accepted[encoding] and os.path.isfile(os.path.join(folder, filename + suffix)):
+            response = send_from_directory(
+                folder, filename + suffix, max_age=MAX_AGE, conditional=True
+            )
+            # send_from_directory guesses the type from the last suffix
+            response.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(folder, filename, max_age=MAX_AGE, conditional=True)
+    response.headers["Cache-Control"] = f"public, max-age={MAX_AGE}, immutable"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def build_assets(static_folder):
+    """write the hashed copies, their compressed variants and the manifest,
+    returns the manifest"""
+    dist = os.path.join(static_folder, DIST)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            stem, ext = os.path.splitext(filename)
+            hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(data)
+            if ext in COMPRESSIBLE:
+                with open(target + ".gz", "wb") as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + ".br", "wb") as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[filename] = hashed
+    # written last: a half built directory is never used
+    with open(os.path.join(dist, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress the static files."""
+    manifest = build_assets(current_app.static_folder)
+    click.echo(f"built {len(manifest)} static files in {_dist_folder()}")
@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+from datetime import datetime
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import event, insert
+
+from app import db
+from app.models import Applog
+from app.consumption import is_consumption, record_consumption
+from app.metrics import count_inventory_event
+
+# Log rows written during a request are buffered in g and inserted with one
+# bulk INSERT per table right before the request's own commit, so that the
+# change and its log row are committed, or rolled back, together: views log
+# before they commit. Rows still buffered when the request ends, logged by a
+# view that does not commit, are written then; a rollback drops them.
+#
+# With AUDIT_ASYNC enabled the rows collected by a request are handed to a
+# background thread through a bounded queue instead: the request does not
+# wait for them, but they are lost if the worker dies before writing them.
+# When the queue is full they are written synchronously.
+
+AUDIT_QUEUE_SIZE = 1000
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def log_event(model, **values):
+    """record a log row of model (Applog or CalibrationsLog)"""
+    values.setdefault("event_time", datetime.now())
+    if has_request_context():
+        g.setdefault("audit_events", []).append((model, values))
+        return
+    write_events([(model, values)])
+    db.session.commit()
+
+
+def write_events(events):
+    """insert events with one statement per table, the caller commits"""
+    tables = {}
+    for model, values in events:
+        tables.setdefault(model, []).append(values)
+    for model, rows in tables.items():
+        # executemany needs the same keys in every row
+        keys = set().union(*rows)
+        db.session.execute(insert(model), [{k: r.get(k) for k in keys} for r in rows])
+        if model is Applog:
+            for r in rows:
+                count_inventory_event(r.get("event_type"))
+                if is_consumption(r.get("event_type")):
+                    record_consumption(r.get("product_id"), r["event_time"].date())
+
+
+def _pop_events():
+    events = g.get("audit_events")
+    g.audit_events = []
+    return events
+
+
+# inserted first so that app.versions sees the rows written here
+@event.listens_for(db.session, "before_commit", insert=True)
+def _write_before_commit(session):
+    if not has_request_context() or current_app.config.get("AUDIT_ASYNC"):
+        return
+    events = _pop_events()
+    if events:
+        write_events(events)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _drop_on_rollback(session, previous_transaction):
+    # the change being logged was not committed
+    if has_request_context() and previous_transaction.parent is None:
+        g.pop("audit_events", None)
+
+
+def write_at_request_end(response):
+    """after_request handler, registered by create_app"""
+    events = _pop_events()
+    if not events:
+        return response
+    if current_app.config.get("AUDIT_ASYNC") and _enqueue(events):
+        return response
+    try:
+        write_events(events)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"error writing {len(events)} log events: {str(e)}")
+    return response
+
+
+def _enqueue(events):
+    global _queue, _queue_pid
+    app = current_app._get_current_object()
+    with _queue_lock:
+        # one worker per process, started after gunicorn forks
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = queue.Queue(maxsize=app.config.get("AUDIT_QUEUE_SIZE", AUDIT_QUEUE_SIZE))
+            _queue_pid = os.getpid()
+            threading.Thread(target=_worker, args=(_queue,), daemon=True).start()
+    try:
+        _queue.put_nowait((app, events))
+    except queue.Full:
+        return False
+    return True
+
+
+def _worker(q):
+    while True:
+        app, events = q.get()
+        with app.app_context():
+            try:
+                write_events(events)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"error writing {len(events)} log events: {str(e)}")
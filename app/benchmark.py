@@ -0,0 +1,319 @@
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_security import hash_password
+from sqlalchemy import event
+
+from app import create_app, db
+from app.commands import ROLES
+from app.config import Config
+from app.models import (
+    Applog,
+    Calibrations,
+    CalibrationsLog,
+    Departments,
+    Inventory,
+    Locations,
+    Role,
+)
+
+# Per route benchmark on synthetic data:
+#   flask benchmark --scale medium                  measure and compare
+#   flask benchmark --scale medium --save-baseline  measure and store
+# A new application is built against a temporary SQLite database seeded
+# at the chosen scale, then every route is requested through the test
+# client, logged in as a user with all the roles. For each route the
+# latency percentiles and the SQL statements per request are reported and
+# compared with the baseline of the same scale: the command fails when
+# the median latency grows past the threshold or a route runs more
+# statements than before (an N+1 query shows up right away).
+# Baselines depend on the machine, keep them next to the CI that runs it.
+
+SCALES = {
+    # reagents, log rows, calibrations
+    "small": (1000, 20000, 200),
+    "medium": (10000, 1000000, 5000),
+    "large": (100000, 10000000, 5000),
+}
+
+ROUTES = [
+    "/list",
+    "/list_data?draw=1&start=0&length=200",
+    "/stats",
+    "/show_log/0/",
+    "/export",
+    "/view_low_quantity/",
+    "/list_calibrations_expiring",
+]
+
+# short names matching the department roles of app.commands.ROLES
+DEPARTMENTS = [("Quality control", "QC"), ("Virology", "VL")]
+LOCATIONS_PER_DEPARTMENT = 25
+EVENT_TYPES = ["added", "removed", "updated", "moved", "ordered"]
+SEED_CHUNK = 10000
+USER = ("bench@example.com", "bench", "benchmark")
+THRESHOLD = 0.25
+
+
+def _chunks(rows, size=SEED_CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert(model, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(model.__table__.insert(), chunk)
+    db.session.commit()
+
+
+def seed(reagents, logs, calibrations, seed_value=0):
+    """fill the empty database of the current app with synthetic data"""
+    from app.consumption import rebuild_consumption
+    from app.functions import calibration_due_date
+    from app.search import rebuild_index
+
+    rng = random.Random(seed_value)
+    today = date.today()
+    datastore = current_app.security.datastore
+    for name, description in ROLES:
+        datastore.put(Role(name=name, description=description, permissions=name))
+    email, username, password = USER
+    user = datastore.create_user(
+        email=email,
+        username=username,
+        password=hash_password(password),
+        roles=[name for name, _ in ROLES],
+        active=True,
+    )
+    db.session.commit()
+
+    _insert(Departments, ({"name": n, "short_name": s} for n, s in DEPARTMENTS))
+    departments = [d.id for d in Departments.query.order_by(Departments.id)]
+    _insert(Locations, (
+        {"name": f"Location {d}-{i}", "short_name": f"L{d}{i}", "department_id": d}
+        for d in departments
+        for i in range(LOCATIONS_PER_DEPARTMENT)
+    ))
+    locations = [loc.id for loc in Locations.query.order_by(Locations.id)]
+
+    _insert(Inventory, (
+        {
+            "name": f"Reagent {i} {rng.choice(['acid', 'buffer', 'salt', 'solvent', 'kit'])}",
+            "location_id": rng.choice(locations),
+            "cas_number": f"{rng.randint(50, 99999)}-{rng.randint(10, 99)}-{rng.randint(0, 9)}",
+            "product_code": f"PC{i}",
+            "supplier": rng.choice(["Sigma", "Merck", "Thermo", "VWR"]),
+            "batch": f"B{rng.randint(1, 99999)}",
+            "expiry_date": (today + timedelta(days=rng.randint(-90, 900))).isoformat(),
+            "amount": rng.randint(0, 12),
+            "amount2": rng.randint(0, 12),
+            "amount_limit": rng.randint(0, 6),
+            "size": rng.choice(["100 ml", "500 ml", "1 l", "25 g", "100 g"]),
+            "order": rng.randint(0, 2),
+            "version": 0,
+        }
+        for i in range(reagents)
+    ))
+
+    def calibration(i):
+        frequency_units = rng.choice(["weeks", "months", "years"])
+        tolerance_units = rng.choice(["days", "weeks"])
+        tolerance = rng.randint(1, 3)
+        last = today - timedelta(days=rng.randint(0, 400))
+        next_date = last + timedelta(days=rng.randint(-30, 400))
+        return {
+            "name": f"Apparatus {i}",
+            "apparatus": f"A{i}",
+            "description": rng.choice(["pipette", "balance", "frit", "thermometer"]),
+            "department_id": rng.choice(departments),
+            "initial_check_date": last - timedelta(days=rng.randint(0, 1000)),
+            "frequency": rng.randint(1, 6),
+            "frequency_units": frequency_units,
+            "tolerance": tolerance,
+            "tolerance_units": tolerance_units,
+            "last_calibration_date": last,
+            "next_calibration_date": next_date,
+            "due_date": calibration_due_date(next_date, tolerance, tolerance_units),
+            "version": 0,
+        }
+
+    _insert(Calibrations, (calibration(i) for i in range(calibrations)))
+
+    # two years of events, newest last
+    start = datetime.now() - timedelta(days=730)
+    step = 730 * 86400 / max(logs, 1)
+    _insert(Applog, (
+        {
+            "product_id": rng.randint(1, reagents),
+            "user_id": user.id,
+            "event_time": start + timedelta(seconds=i * step),
+            "event_type": event_type,
+            "quantity_delta": {"added": 1, "removed": -1}.get(event_type),
+            "event_detail": f"{event_type} itemid {i}",
+        }
+        for i in range(logs)
+        for event_type in (rng.choice(EVENT_TYPES),)
+    ))
+    _insert(CalibrationsLog, (
+        {
+            "calibration_id": rng.randint(1, calibrations),
+            "user_id": user.id,
+            "event_time": start + timedelta(days=rng.randint(0, 730)),
+            "event_detail": f"Set calibration date {i}",
+        }
+        for i in range(calibrations * 4)
+    ))
+    rebuild_index()
+    rebuild_consumption()
+
+
+def percentile(values, p):
+    """nearest rank percentile of values"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def measure(app, routes, requests):
+    """{route: {p50_ms, p90_ms, p99_ms, sql}} of requests GETs per route"""
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count)
+    client = app.test_client()
+    email, _, password = USER
+    client.post("/login", data={"email": email, "password": password})
+    results = {}
+    for route in routes:
+        client.get(route).get_data()  # warm up
+        times = []
+        counts = []
+        for _ in range(requests):
+            statements[0] = 0
+            started = time.perf_counter()
+            response = client.get(route)
+            response.get_data()
+            times.append((time.perf_counter() - started) * 1000)
+            counts.append(statements[0])
+            if response.status_code != 200:
+                raise click.ClickException(f"{route} answered {response.status_code}")
+        results[route] = {
+            "p50_ms": round(percentile(times, 50), 2),
+            "p90_ms": round(percentile(times, 90), 2),
+            "p99_ms": round(percentile(times, 99), 2),
+            "sql": max(counts),
+        }
+    with app.app_context():
+        event.remove(db.engine, "before_cursor_execute", count)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """messages of the routes slower or running more statements than baseline"""
+    found = []
+    for route, result in results.items():
+        base = baseline.get(route)
+        if base is None:
+            continue
+        if result["p50_ms"] > base["p50_ms"] * (1 + threshold):
+            found.append(f"{route}: median {result['p50_ms']} ms, baseline {base['p50_ms']} ms")
+        if result["sql"] > base["sql"]:
+            found.append(f"{route}: {result['sql']} statements, baseline {base['sql']}")
+    return found
+
+
+def _benchmark_config(directory, page_cache):
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+        LOG_ARCHIVE_DIR = os.path.join(directory, "log_archive")
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        WTF_CSRF_ENABLED = False
+        AUDIT_ASYNC = False
+        # the rendering is measured, not the page cache, unless asked
+        PAGE_CACHE = "memory" if page_cache else None
+
+    return BenchmarkConfig
+
+
+@click.command("benchmark")
+@click.option("--scale", type=click.Choice(sorted(SCALES)), default="small", show_default=True)
+@click.option("--reagents", type=int, help="Reagents, instead of the scale's.")
+@click.option("--logs", type=int, help="Log rows, instead of the scale's.")
+@click.option("--calibrations", type=int, help="Calibrations, instead of the scale's.")
+@click.option("--requests", type=int, default=20, show_default=True, help="Requests per route.")
+@click.option("--route", "routes", multiple=True, help="Route to measure, all by default.")
+@click.option("--baseline", type=click.Path(dir_okay=False), help="Baselines file, in the instance folder by default.")
+@click.option("--save-baseline", is_flag=True, help="Store the results as the baseline of the scale.")
+@click.option("--threshold", type=float, default=THRESHOLD, show_default=True,
+              help="Allowed growth of the median latency.")
+@click.option("--page-cache", is_flag=True, help="Keep the page cache enabled.")
+@click.option("--keep", is_flag=True, help="Keep the seeded database.")
+@with_appcontext
+def benchmark_command(scale, reagents, logs, calibrations, requests, routes, baseline,
+                      save_baseline, threshold, page_cache, keep):
+    """Measure the main routes on a seeded temporary database."""
+    default_reagents, default_logs, default_calibrations = SCALES[scale]
+    size = {
+        "reagents": reagents or default_reagents,
+        "logs": logs if logs is not None else default_logs,
+        "calibrations": calibrations or default_calibrations,
+    }
+    key = "{reagents}-{logs}-{calibrations}".format(**size)
+    baseline = baseline or os.path.join(current_app.instance_path, "benchmark-baseline.json")
+    directory = tempfile.mkdtemp(prefix="reagentario-benchmark-")
+    app = create_app(_benchmark_config(directory, page_cache))
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            db.create_all()
+            seed(**size)
+            click.echo(f"seeded {key} (reagents-logs-calibrations) in {time.perf_counter() - started:.1f} s")
+        results = measure(app, list(routes) or ROUTES, requests)
+    finally:
+        if keep:
+            click.echo(f"database kept in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    try:
+        with open(baseline) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    previous = baselines.get(key, {})
+    click.echo(f"{'route':45} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'sql':>5} {'base p50':>9} {'base sql':>8}")
+    for route, result in results.items():
+        base = previous.get(route, {})
+        click.echo(f"{route:45} {result['p50_ms']:9.2f} {result['p90_ms']:9.2f} {result['p99_ms']:9.2f} "
+                   f"{result['sql']:5d} {base.get('p50_ms', ''):>9} {base.get('sql', ''):>8}")
+
+    if save_baseline:
+        baselines[key] = {**previous, **results}
+        os.makedirs(os.path.dirname(os.path.abspath(baseline)), exist_ok=True)
+        with open(baseline, "w") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+        click.echo(f"baseline of {key} stored in {baseline}")
+        return
+    found = regressions(results, previous, threshold)
+    for message in found:
+        click.echo(f"REGRESSION {message}", err=True)
+    if found:
+        sys.exit(1)
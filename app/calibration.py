@@ -7,6 +7,8 @@ from datetime import (
 from dateutil.relativedelta import relativedelta
 
 from flask import (
+    Blueprint,
+    current_app,
     render_template,
     make_response,
     flash,
@@ -15,19 +17,31 @@ from flask import (
     request,
     session,
     send_file,
+    jsonify,
 )
-from app import app
 from app import db
-from app import log
 from app.forms import (
     CreateCalibrationForm,
     EditCalibrationForm,
     SetFritsDateForm,
+    department_choices,
 )
-from app.models import Calibrations, Departments, CalibrationsLog
-from app.functions import add_calibration_log, calculate_next_calibration_date, calculate_relativedelta
+from app.models import Calibrations, Departments, CalibrationsLog, User
+from app.functions import add_calibration_log, calibration_next_date, reschedule_calibrations
+from app.queries import (
+    calibrations_query,
+    calibrationlog_options,
+    permitted,
+    permitted_calibrations,
+    calibrations_due_today,
+    calibrations_due_within,
+    calibrations_overdue,
+)
+from app.export import csv_response, stream_query
+from app.logs import LOG_PAGE_SIZE, calibrationlog_row, log_filters, log_page
+from app.pagecache import cached_page
 
-from sqlalchemy import inspect
+from sqlalchemy import inspect, select
 from sqlalchemy.exc import IntegrityError, PendingRollbackError
 
 from flask_security import (
@@ -38,13 +52,16 @@ from flask_security import (
     UserMixin,
 )
 
+bp = Blueprint("calibration", __name__)
+
 
-@app.route("/list_calibrations")
+@bp.route("/list_calibrations")
 @auth_required()
+@cached_page("calibrations", "departments")
 def list_calibrations():
     """list all calibrations"""
 
-    calibrations = Calibrations.query.all()
+    calibrations = permitted_calibrations(calibrations_query()).all()
     #calibrations = Calibrations.query.filter(Department=deps).all()
     #calibrations = db.session.query(Calibrations, Departments).join(Departments).all()
 
@@ -69,8 +86,9 @@ def list_calibrations():
     return render_template("list_calibrations.html", warning=msg, title="Calibrations")
 
 
-@app.route("/list_calibrations_next_month")
+@bp.route("/list_calibrations_next_month")
 @auth_required()
+@cached_page("calibrations", "departments")
 def list_calibrations_next_month():
     """list calibrations expiring next month"""
 
@@ -78,7 +96,7 @@ def list_calibrations_next_month():
         next_month = 1
     else:
         next_month = datetime.now().month + 1
-    app.logger.info(next_month)
+    current_app.logger.info(next_month)
     month = date.today().replace(day=1).replace(month=next_month).strftime("%B-%Y")
 
 
@@ -91,7 +109,8 @@ def list_calibrations_next_month():
     # come back to the first next month's last day
     to_date = nm - timedelta(days=nm.day)
     calibrations = (
-        Calibrations.query.filter(Calibrations.next_calibration_date >= from_date)
+        permitted_calibrations(calibrations_query())
+        .filter(Calibrations.next_calibration_date >= from_date)
         .filter(Calibrations.next_calibration_date <= to_date)
         .all()
     )
@@ -106,8 +125,9 @@ def list_calibrations_next_month():
     return render_template("list_calibrations.html", warning=msg, title=title)
 
 
-@app.route("/list_calibrations_this_month")
+@bp.route("/list_calibrations_this_month")
 @auth_required()
+@cached_page("calibrations", "departments")
 def list_calibrations_this_month():
     """list calibrations expiring this month"""
 
@@ -120,7 +140,8 @@ def list_calibrations_this_month():
     # come back to this month's last day
     to_date = nm - timedelta(days=nm.day)
     calibrations = (
-        Calibrations.query.filter(Calibrations.next_calibration_date >= from_date)
+        permitted_calibrations(calibrations_query())
+        .filter(Calibrations.next_calibration_date >= from_date)
         .filter(Calibrations.next_calibration_date <= to_date)
         .all()
     )
@@ -134,18 +155,13 @@ def list_calibrations_this_month():
     msg = "No Calibrations Found"
     return render_template("list_calibrations.html", warning=msg, title=title)
 
-@app.route("/list_calibrations_expiring")
+@bp.route("/list_calibrations_expiring")
 @auth_required()
+@cached_page("calibrations", "departments")
 def list_calibrations_expiring():
     """list calibrations expiring today"""
 
-    calibrations = Calibrations.query.all()
-
-    expiring = []
-
-    for c in calibrations:
-        if date.today() - calculate_relativedelta(c.next_calibration_date, c.tolerance_units, c.tolerance, 1) == timedelta(days=0):
-            expiring.append(c)
+    expiring = calibrations_due_today().all()
 
     title = "Calibrations expiring to be performed today !!!"
 
@@ -157,9 +173,46 @@ def list_calibrations_expiring():
     return render_template("list_calibrations.html", warning=msg, title=title)
 
 
+@bp.route("/list_calibrations_due")
+@auth_required()
+@cached_page("calibrations", "departments")
+def list_calibrations_due():
+    """list calibrations due within the next days (default 30)"""
+
+    days = max(request.args.get("days", 30, type=int), 0)
+    calibrations = calibrations_due_within(days).all()
+
+    title = f"Calibrations due within {days} days"
+
+    if len(calibrations) > 0:
+        return render_template(
+            "list_calibrations.html", calibrations=calibrations, title=title
+        )
+    msg = f"No Calibrations Found due within {days} days"
+    return render_template("list_calibrations.html", warning=msg, title=title)
+
+
+@bp.route("/list_calibrations_overdue")
+@auth_required()
+@cached_page("calibrations", "departments")
+def list_calibrations_overdue():
+    """list calibrations whose due date has passed"""
+
+    calibrations = calibrations_overdue().all()
+
+    title = "Calibrations overdue !!!"
+
+    if len(calibrations) > 0:
+        return render_template(
+            "list_calibrations.html", calibrations=calibrations, title=title
+        )
+    msg = "No overdue Calibrations Found"
+    return render_template("list_calibrations.html", warning=msg, title=title)
 
-@app.route("/show_calibration/<int:_id>/")
+
+@bp.route("/show_calibration/<int:_id>/")
 @auth_required()
+@cached_page("calibrations", "departments")
 def show_calibration(_id):
     """show a specific calibration"""
     calibration = Calibrations.query.get_or_404(_id)
@@ -176,7 +229,7 @@ def show_calibration(_id):
     )
 
 
-@app.route("/create_calibration", methods=["GET", "POST"])
+@bp.route("/create_calibration", methods=["GET", "POST"])
 @auth_required()
 @roles_required("admin")
 def create_calibration():
@@ -204,6 +257,10 @@ def create_calibration():
         tolerance_units = request.form["tolerance_units"]
         last_calibration_date = request.form["last_calibration_date"]
         notes = request.form["notes"]
+        # the form is not validated here, see the defaults set above
+        if not frequency.isdigit() or int(frequency) <= 0:
+            flash("Calibration frequency must be a positive number", "danger")
+            return redirect(url_for("calibration.create_calibration"))
         # calculate a next calibration time
         init = datetime.strptime(initial_check_date, "%Y-%m-%d").date()
         if frequency_units == "days":
@@ -232,44 +289,44 @@ def create_calibration():
             notes=notes,
         )
 
-        if not current_user.has_role(department.short_name):
+        if not permitted(department.id):
             flash(
                 f"You have not permission to add a calibration in a location pertaining to {department.name}",
                 "danger",
             )
-            return redirect(url_for("create_calibration"))
+            return redirect(url_for("calibration.create_calibration"))
 
         db.session.add(calibration)
-        db.session.commit()
-        db.session.refresh(calibration)
+        db.session.flush()
         add_calibration_log(
             calibration.id,
             current_user.id,
             f"created calibration {calibration.id} - {calibration.name}",
         )
-        return redirect(url_for("list_calibrations"))
+        db.session.commit()
+        return redirect(url_for("calibration.list_calibrations"))
 
     return render_template("create_calibration.html", form=form, title=title)
 
 
-@app.route("/edit_calibration/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/edit_calibration/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
 @roles_required("admin")
 def edit_calibration(_id):
     """edit a specific calibration"""
     calib = db.session.query(Calibrations).filter(Calibrations.id == _id).first_or_404()
 
-    dep = [(dep.id, dep.name) for dep in Departments.query.all()]
+    dep = department_choices()
     form = EditCalibrationForm(csrf_enabled=False, exclude_fk=False, obj=calib)
     form.department.choices = dep
     form.department.data = calib.department.id
 
-    if not current_user.has_role(calib.department.short_name):
+    if not permitted(calib.department_id):
         flash(
             f"You have not permission to edit a calibration pertaining to {calib.department.name}",
             "danger",
         )
-        return redirect(url_for("show_calibration", _id=_id))
+        return redirect(url_for("calibration.show_calibration", _id=_id))
 
     r1 = calib.__dict__.copy()
 
@@ -285,14 +342,18 @@ def edit_calibration(_id):
         calib.tolerance = request.form["tolerance"]
         calib.tolerance_units = request.form["tolerance_units"]
         calib.last_calibration_date = request.form["last_calibration_date"]
-        calib.next_calibration_date = calculate_next_calibration_date(calib.id)
+        try:
+            calib.next_calibration_date = calibration_next_date(calib)
+        except ValueError as e:
+            flash(f"Error updating {str(e)}", "danger")
+            db.session.rollback()
+            return redirect(url_for("calibration.edit_calibration", _id=_id))
         calib.notes = request.form["notes"]
         r2 = calib.__dict__.copy()
         k1 = set(r1.keys())
         k2 = set(r2.keys())
         common_keys = set(k1).intersection(set(k2))
         try:
-            db.session.commit()
             for key in common_keys:
                 if str(r1[key]) != str(r2[key]):
                     add_calibration_log(
@@ -300,17 +361,18 @@ def edit_calibration(_id):
                         current_user.id,
                         f'updated calibration {calib.id} - {calib.name}: {key} value changed from "{str(r1[key])}" to "{str(r2[key])}"',
                     )
+            db.session.commit()
         except Exception as e:
             flash(f"Error updating {str(e)}", "danger")
             db.session.rollback()
-        return redirect(url_for("show_calibration", _id=_id))
+        return redirect(url_for("calibration.show_calibration", _id=_id))
 
     return render_template(
         "edit_calibration.html", _id=_id, form=form, title="Edit calibration"
     )
 
 
-@app.route("/delete_calibration/<int:_id>/", methods=["GET"])
+@bp.route("/delete_calibration/<int:_id>/", methods=["GET"])
 @auth_required()
 @roles_required("admin")
 def delete_calibration(_id):
@@ -318,55 +380,100 @@ def delete_calibration(_id):
 
     calibration = db.session.query(Calibrations).filter(Calibrations.id == _id).first()
     if calibration:
-        if not current_user.has_role(calibration.department.short_name):
+        if not permitted(calibration.department_id):
             flash(
                 f"You have not permission to delete a calibration pertaining to {calibration.department.name}",
                 "danger",
             )
-            return redirect(url_for("show_calibration", _id=_id))
+            return redirect(url_for("calibration.show_calibration", _id=_id))
 
         try:
-            db.session.delete(calibration)
-            db.session.commit()
             add_calibration_log(
-                calibration.id,
+                None,
                 current_user.id,
                 f"deleted calibration {calibration.id} - {calibration.name}",
             )
+            db.session.delete(calibration)
+            db.session.commit()
             flash("Calibration deleted", "info")
         except Exception as e:
             flash(f"Error deleting {calibration.id} with error {str(e)}", "danger")
             db.session.rollback()
     else:
         flash(f"Error deleting calibration with id {_id}", "danger")
-        return redirect(url_for("show_calibration", _id=_id))
-    return redirect(url_for("list_calibrations"))
+        return redirect(url_for("calibration.show_calibration", _id=_id))
+    return redirect(url_for("calibration.list_calibrations"))
 
 
-@app.route("/show_calibration_log/<int:_id>/")
+@bp.route("/show_calibration_log/<int:_id>/")
 @auth_required()
 @roles_required("admin")
+@cached_page("calibrationlog", "calibrations", "departments", "user")
 def show_calibration_log(_id):
-    """list logs"""
+    """list logs, one page at a time (all calibrations for id 0)"""
+    filters = log_filters(CalibrationsLog, request.args, _id or None)
+    logs, cursor = log_page(
+        CalibrationsLog,
+        filters,
+        request.args.get("after"),
+        request.args.get("length", LOG_PAGE_SIZE, type=int),
+        calibrationlog_options(),
+    )
+    if not logs and not request.args.get("after"):
+        flash("No Logs Found for this calibration !", "info")
+    return render_template(
+        "show_calibration_log.html",
+        logs=logs,
+        filters={k: str(v) for k, v in filters.items() if k != "subject"},
+        cursor=cursor,
+        title="Calibration Logs report",
+    )
 
-    if request.method == "GET":
-        if _id == 0:
-            logs = CalibrationsLog.query.all()
-        else:
-            logs = CalibrationsLog.query.filter(
-                CalibrationsLog.calibration_id == _id
-            ).all()
 
-    if len(logs) > 0:
-        flash(f"Log rows: {str(len(logs))}", "info")
-        return render_template(
-            "show_calibration_log.html", logs=logs, title="Calibration Logs report"
+@bp.route("/calibration_log_data", methods=["GET"])
+@auth_required()
+@roles_required("admin")
+def calibration_log_data():
+    """one page of calibration logs as json, see app.logs.log_filters for the
+    arguments; the next page is requested with after=<next>"""
+    filters = log_filters(CalibrationsLog, request.args)
+    logs, cursor = log_page(
+        CalibrationsLog,
+        filters,
+        request.args.get("after"),
+        request.args.get("length", LOG_PAGE_SIZE, type=int),
+        calibrationlog_options(),
+    )
+    return jsonify({"data": [calibrationlog_row(log) for log in logs], "next": cursor})
+
+
+@bp.route("/export_calibration_log", methods=["GET"])
+@auth_required()
+@roles_required("superadmin")
+def export_calibration_log():
+    """export calibration log table as csv"""
+    rows = stream_query(
+        select(
+            CalibrationsLog.id,
+            CalibrationsLog.event_time,
+            CalibrationsLog.calibration_id,
+            Calibrations.name,
+            User.username,
+            CalibrationsLog.event_detail,
         )
-    flash("No Logs Found for this calibration !", "info")
-    return render_template("show_calibration_log.html", title="Calibration Logs report")
+        .outerjoin(Calibrations, CalibrationsLog.calibration_id == Calibrations.id)
+        .outerjoin(User, CalibrationsLog.user_id == User.id)
+        .order_by(CalibrationsLog.id)
+    )
+    return csv_response(
+        "calibration_log.csv",
+        ["Id", "Date", "calibration id", "calibration name", "user", "detail"],
+        rows,
+        request.args.get("compression"),
+    )
 
 
-@app.route("/set_calibration_date/<int:_id>/")
+@bp.route("/set_calibration_date/<int:_id>/")
 @auth_required()
 @roles_required("admin")
 def set_calibration_date(_id):
@@ -374,51 +481,33 @@ def set_calibration_date(_id):
     calib = db.session.query(Calibrations).filter(Calibrations.id == _id).first()
 
     if calib:
-        if not current_user.has_role(calib.department.short_name):
+        if not permitted(calib.department_id):
             flash(
                 f"You have not permission to set calibration date for something pertaining to {calib.department.name}",
                 "danger",
             )
-            return redirect(url_for("show_calibration", _id=_id))
-
-        calib.last_calibration_date = date.today()
+            return redirect(url_for("calibration.show_calibration", _id=_id))
 
         try:
-            db.session.commit()
+            for name, description, last, nextc in reschedule_calibrations(
+                [calib], date.today(), current_user.id
+            ):
+                flash(
+                    f"Set calibration date for {name} - {description}   (last: {last}, next: {nextc})",
+                    "info",
+                )
         except Exception as e:
             flash(
-                f"Error setting last calibration date for {calib.id} - {calib.name} with error {str(e)}",
+                f"Error setting calibration date for {calib.id} - {calib.name} with error {str(e)}",
                 "danger",
             )
-
-            db.session.rollback()
-
-        calib.next_calibration_date = calculate_next_calibration_date(_id)
-
-        try:
-            db.session.commit()
-            flash(
-                f"Set calibration date for {calib.name} - {calib.description}   (last: {calib.last_calibration_date}, next: {calib.next_calibration_date})",
-                "info",
-            )
-            add_calibration_log(
-                calib.id,
-                current_user.id,
-                f"Set calibration date for {calib.id} - {calib.name} - {calib.description} - {calib.last_calibration_date}",
-            )
-        except Exception as e:
-            flash(
-                f"Error setting next calibration date for {calib.id} - {calib.name} with error {str(e)}",
-                "danger",
-            )
-            db.session.rollback()
     else:
         flash(f"Error setting calibration for id {str(_id)}", "danger")
-        return redirect(url_for("show_calibration", _id=_id))
-    return redirect(url_for("show_calibration", _id=_id, title=calib.name))
+        return redirect(url_for("calibration.show_calibration", _id=_id))
+    return redirect(url_for("calibration.show_calibration", _id=_id, title=calib.name))
 
 
-@app.route("/set_frit_change_date/", methods=["GET", "POST"])
+@bp.route("/set_frit_change_date/", methods=["GET", "POST"])
 @auth_required()
 @roles_required("admin")
 def set_frit_change_date():
@@ -431,59 +520,41 @@ def set_frit_change_date():
         department = Departments.query.get_or_404(form.department.data)
         last_calibration_date = request.form["last_calibration_date"]
 
-        calibs = db.session.query(Calibrations).filter(db.and_(
+        calibs = calibrations_query().filter(db.and_(
             Calibrations.description == "frit",
             Calibrations.department == department,
             )
         ).all()
 
         if calibs:
+            allowed = []
             for calib in calibs:
-                if not current_user.has_role(calib.department.short_name):
+                if not permitted(calib.department_id):
                     flash(
                          f"You have not permission to set frit change date for instrument {calib.name} pertaining to {calib.department.name}",
                          "danger",
                     )
                     continue
+                allowed.append(calib)
 
-                calib.last_calibration_date = last_calibration_date
-
-                try:
-                    db.session.commit()
-                except Exception as e:
+            try:
+                for name, description, last, nextc in reschedule_calibrations(
+                    allowed, last_calibration_date, current_user.id
+                ):
                     flash(
-                        f"Error setting last calibration date for {calib.id} - {calib.name} with error {str(e)}",
-                        "danger",
-                    )
-                    db.session.rollback()
-
-                calib.next_calibration_date = calculate_next_calibration_date(calib.id)
-
-                try:
-                    db.session.commit()
-                    flash(
-                        f"Set calibration date for {calib.name} - {calib.description}   (last: {calib.last_calibration_date}, next: {calib.next_calibration_date})",
+                        f"Set calibration date for {name} - {description}   (last: {last}, next: {nextc})",
                         "info",
                     )
-                    add_calibration_log(
-                        calib.id,
-                        current_user.id,
-                        f"Set calibration date for {calib.id} - {calib.name} - {calib.description} - {calib.last_calibration_date}",
-                    )
-                except Exception as e:
-                    flash(
-                        f"Error setting next calibration date for {calib.id} - {calib.name} with error {str(e)}",
-                        "danger",
-                    )
-                    db.session.rollback()
+            except Exception as e:
+                flash(f"Error setting frit change date with error {str(e)}", "danger")
         else:
             flash(f"Cannot find any frit in calibration description for department {department}", "danger")
-            return redirect(url_for("list_calibrations"))
-        return redirect(url_for("list_calibrations" ))
+            return redirect(url_for("calibration.list_calibrations"))
+        return redirect(url_for("calibration.list_calibrations" ))
     return render_template("set_frit_change_date.html", form=form, title="Set Frit Change Date")
 
 
-@app.template_filter("datedelta")
+@bp.app_template_filter("datedelta")
 def datedelta(next_cal, tolerance, unit):
     color = ''
     today = date.today()
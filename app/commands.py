@@ -0,0 +1,69 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_security import hash_password
+
+from app import db
+from app.models import Role
+
+# one time setup, run once per deploy instead of at every worker start:
+#   flask init-db && flask seed-roles
+
+ROLES = [
+    # name, description
+    ("admin", "admin role"),
+    ("superadmin", "superadmin role"),
+    ("QC", "QC dept"),
+    ("VL", "VL dept"),
+]
+
+DEMO_USERS = [
+    # email, username, roles
+    ("user@test.com", "User1", []),
+    ("admin@test.com", "Admin1", ["admin"]),
+    ("admin2@test.com", "Admin2", ["admin", "superadmin"]),
+]
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Create the missing database tables."""
+    db.create_all()
+    click.echo("database tables created")
+
+
+@click.command("seed-roles")
+@with_appcontext
+def seed_roles_command():
+    """Create the admin, superadmin and department roles if missing."""
+    datastore = current_app.security.datastore
+    created = 0
+    for name, description in ROLES:
+        if not datastore.find_role(name):
+            # the permissions column is plain text, not a list
+            datastore.put(Role(name=name, description=description, permissions=name))
+            created += 1
+    db.session.commit()
+    click.echo(f"created {created} roles")
+
+
+@click.command("seed-demo-users")
+@with_appcontext
+@click.option("--password", default="password", help="Password of the demo users.")
+def seed_demo_users_command(password):
+    """Create the test users (roles must exist, see seed-roles)."""
+    datastore = current_app.security.datastore
+    created = 0
+    for email, username, roles in DEMO_USERS:
+        if not datastore.find_user(email=email):
+            datastore.create_user(
+                email=email,
+                password=hash_password(password),
+                username=username,
+                roles=roles,
+                active=True,
+            )
+            created += 1
+    db.session.commit()
+    click.echo(f"created {created} users")
@@ -0,0 +1,116 @@
+from datetime import date, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.archive import archived_rows
+from app.models import Applog, ConsumptionDaily, Departments, Inventory, Locations
+
+# log event type counted as a consumption by the stats report
+CONSUMPTION_EVENT = "updated"
+
+
+def is_consumption(event_type):
+    return event_type == CONSUMPTION_EVENT
+
+
+def record_consumption(product_id, day, count=1):
+    """add count to the daily rollup of a product, the caller commits"""
+    if product_id is None:
+        return
+    row = (
+        update(ConsumptionDaily)
+        .where(ConsumptionDaily.product_id == product_id, ConsumptionDaily.day == day)
+        .values(consumed=ConsumptionDaily.consumed + count)
+    )
+    if db.session.execute(row).rowcount:
+        return
+    try:
+        # another worker may create the row of the day at the same time
+        with db.session.begin_nested():
+            db.session.execute(
+                insert(ConsumptionDaily).values(product_id=product_id, day=day, consumed=count)
+            )
+    except IntegrityError:
+        db.session.execute(row)
+
+
+def forget_consumption(product_id):
+    """remove the daily rollup of a deleted product, the caller commits
+
+    Not left to the foreign key cascade, SQLite does not enforce it, and a
+    new reagent given the same id would inherit the consumption.
+    """
+    db.session.execute(delete(ConsumptionDaily).where(ConsumptionDaily.product_id == product_id))
+
+
+def consumption_report(days, department_ids=None):
+    """products consumed in the last days, one row per product:
+    id, name, department (short name) and consumed; products with other
+    events only are not listed
+
+    department_ids: only report the products of these departments
+    """
+    since = date.today() - timedelta(days=days)
+    consumed = func.sum(ConsumptionDaily.consumed).label("consumed")
+    query = (
+        db.session.query(
+            Inventory.id,
+            Inventory.name,
+            Departments.short_name.label("department"),
+            consumed,
+        )
+        .join(ConsumptionDaily, ConsumptionDaily.product_id == Inventory.id)
+        .outerjoin(Locations, Inventory.location_id == Locations.id)
+        .outerjoin(Departments, Locations.department_id == Departments.id)
+        .filter(ConsumptionDaily.day > since, ConsumptionDaily.day <= date.today())
+    )
+    if department_ids is not None:
+        query = query.filter(Locations.department_id.in_(department_ids))
+    return (
+        query.group_by(Inventory.id, Inventory.name, Departments.short_name)
+        .order_by(consumed.desc())
+        .all()
+    )
+
+
+def rebuild_consumption():
+    """recompute the whole daily rollup from the log table and archive"""
+    day = func.date(Applog.event_time)
+    rows = db.session.execute(
+        select(Applog.product_id, day.label("day"), func.count().label("consumed"))
+        # the rollup references the inventory, deleted reagents are left out
+        .join(Inventory, Applog.product_id == Inventory.id)
+        .where(Applog.event_type == CONSUMPTION_EVENT)
+        .group_by(Applog.product_id, day)
+    ).all()
+    counts = {
+        (r.product_id, r.day if isinstance(r.day, date) else date.fromisoformat(str(r.day))): r.consumed
+        for r in rows
+    }
+    # the rows moved to the log archive still count, for the reagents left
+    products = set(db.session.scalars(select(Inventory.id)))
+    for row in archived_rows(Applog):
+        if row["product_id"] in products and is_consumption(row["event_type"]):
+            key = (row["product_id"], date.fromisoformat(row["event_time"][:10]))
+            counts[key] = counts.get(key, 0) + 1
+    db.session.execute(delete(ConsumptionDaily))
+    values = [
+        {"product_id": product_id, "day": day, "consumed": consumed}
+        for (product_id, day), consumed in counts.items()
+    ]
+    if values:
+        db.session.execute(insert(ConsumptionDaily), values)
+    db.session.commit()
+    return len(values)
+
+
+@click.command("rebuild-consumption")
+@with_appcontext
+def rebuild_consumption_command():
+    """Rebuild the daily consumption rollup from the log table and archive."""
+    count = rebuild_consumption()
+    click.echo(f"stored {count} daily consumption rows")
@@ -0,0 +1,138 @@
+import json
+
+from sqlalchemy import and_, or_, Integer
+
+# upper bound for a single page requested by the browser
+MAX_PAGE_LENGTH = 1000
+DEFAULT_PAGE_LENGTH = 200
+
+
+def _int_arg(args, key, default):
+    try:
+        return int(args.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _column_filter(column, value):
+    """per-column filter: exact match on integers, prefix match on strings
+    (a prefix LIKE can use the column index, a leading wildcard cannot)"""
+    if isinstance(column.type, Integer):
+        try:
+            return column == int(value)
+        except ValueError:
+            return None
+    value = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.like(value + "%", escape="\\")
+
+
+def _keyset_filter(column, id_column, direction, cursor):
+    """rows after cursor (value, id) in the order of (column, id)
+
+    The column is compared as it is, so its index can serve the range.
+    NULLs sort lowest, as on MySQL and SQLite: first ascending, last
+    descending; they only need a case of their own in nullable columns.
+    """
+    value, last_id = cursor
+    nullable = getattr(column, "nullable", True)
+    if direction == "desc":
+        if value is None:
+            return and_(column.is_(None), id_column < last_id)
+        after = or_(column < value, and_(column == value, id_column < last_id))
+        return or_(after, column.is_(None)) if nullable else after
+    if value is None:
+        return or_(column.is_not(None), and_(column.is_(None), id_column > last_id))
+    return or_(column > value, and_(column == value, id_column > last_id))
+
+
+def _parse_cursor(raw):
+    if not raw:
+        return None
+    try:
+        cursor = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(cursor, list) or len(cursor) != 2:
+        return None
+    return cursor
+
+
+def server_side_response(query, columns, id_column, args, row_builder, global_search=None,
+                         records_total=None):
+    """answer a DataTables "server-side processing" request
+
+    query: base query selecting the rows visible to the user
+    columns: list of sqlalchemy columns, same order as the table columns
+    id_column: unique column used as keyset tie breaker
+    args: request arguments sent by DataTables
+    row_builder: callable turning a result row into a json serializable dict
+    global_search: optional callable (query, value) -> query for the search box
+    records_total: optional callable counting the rows of query, such as a
+    cached count; the rows are counted on every request without it
+
+    When the browser moves to the next page it sends back the cursor of the
+    last row it received ("after"): the page is then read with a keyset
+    predicate on (sort column, id) instead of an OFFSET, so every request
+    touches only one page of rows. The matching rows are counted only when
+    a filter or a search is applied.
+    """
+    draw = _int_arg(args, "draw", 0)
+    start = max(_int_arg(args, "start", 0), 0)
+    length = _int_arg(args, "length", DEFAULT_PAGE_LENGTH)
+    if length <= 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+
+    if records_total is not None:
+        records_total = records_total()
+    else:
+        records_total = query.order_by(None).count()
+
+    filtered = query
+    narrowed = False
+    for i, column in enumerate(columns):
+        value = args.get(f"columns[{i}][search][value]", "").strip()
+        if value:
+            condition = _column_filter(column, value)
+            if condition is not None:
+                filtered = filtered.filter(condition)
+                narrowed = True
+    search = args.get("search[value]", "").strip()
+    if search and global_search is not None:
+        filtered = global_search(filtered, search)
+        narrowed = True
+
+    if narrowed:
+        records_filtered = filtered.order_by(None).count()
+    else:
+        records_filtered = records_total
+
+    order_index = _int_arg(args, "order[0][column]", 0)
+    if order_index < 0 or order_index >= len(columns):
+        order_index = 0
+    direction = "desc" if args.get("order[0][dir]") == "desc" else "asc"
+    sort_column = columns[order_index]
+    if direction == "desc":
+        page = filtered.order_by(sort_column.desc(), id_column.desc())
+    else:
+        page = filtered.order_by(sort_column.asc(), id_column.asc())
+
+    cursor = _parse_cursor(args.get("after"))
+    if cursor is not None:
+        page = page.filter(_keyset_filter(sort_column, id_column, direction, cursor))
+    elif start:
+        page = page.offset(start)
+
+    rows = page.add_columns(sort_column.label("_sort_key")).limit(length).all()
+
+    next_cursor = None
+    if rows:
+        last = rows[-1]
+        next_cursor = json.dumps([last._sort_key, last._mapping[id_column]])
+
+    return {
+        "draw": draw,
+        "recordsTotal": records_total,
+        "recordsFiltered": records_filtered,
+        "data": [row_builder(row) for row in rows],
+        "cursor": next_cursor,
+    }
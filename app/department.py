@@ -1,4 +1,6 @@
 from flask import (
+    Blueprint,
+    current_app,
     render_template,
     make_response,
     flash,
@@ -7,15 +9,14 @@ from flask import (
     request,
     session,
 )
-from app import app
 from app import db
-from app import log
 from app.forms import (
     EditDepartmentForm,
 )
 from app.models import Inventory, Locations, Departments
 
 from app.functions import add_log
+from app.pagecache import cached_page
 
 from sqlalchemy import inspect
 from sqlalchemy.exc import IntegrityError, PendingRollbackError
@@ -29,9 +30,12 @@ from flask_security import (
     UserMixin,
 )
 
+bp = Blueprint("department", __name__)
 
-@app.route("/list_departments", methods=["GET"])
+
+@bp.route("/list_departments", methods=["GET"])
 @auth_required()
+@cached_page("departments")
 def list_departments():
     """list all departments"""
     departments = Departments.query.all()
@@ -45,7 +49,7 @@ def list_departments():
     return render_template("list_departments.html", warning=msg, title="Departments")
 
 
-@app.route("/create_department", methods=["GET", "POST"])
+@bp.route("/create_department", methods=["GET", "POST"])
 @auth_required()
 @roles_required("superadmin")
 def create_department():
@@ -69,15 +73,15 @@ def create_department():
             )
         db.session.add(department)
         db.session.commit()
-        app.logger.info(
+        current_app.logger.info(
             f"created department {department.id} - {department.name} by user {current_user.id}"
         )
 
-        return redirect(url_for("list_departments"))
+        return redirect(url_for("department.list_departments"))
     return render_template("create_department.html", title="Add a new department")
 
 
-@app.route("/delete_department/<int:_id>/", methods=["GET"])
+@bp.route("/delete_department/<int:_id>/", methods=["GET"])
 @auth_required()
 @roles_required("superadmin")
 def delete_department(_id):
@@ -91,17 +95,18 @@ def delete_department(_id):
                 f"There are locations pertaining to {department.name} department, it cannot be deleted",
                 "danger",
             )
-            return redirect(url_for("list_departments"))
+            return redirect(url_for("department.list_departments"))
         try:
-            db.session.delete(department)
-            db.session.commit()
             add_log(
-                department.id,
+                None,
                 current_user.id,
                 f"deleted department {department.id} - {department.name}",
+                event_type="department_deleted",
             )
+            db.session.delete(department)
+            db.session.commit()
             flash("Department deleted", "info")
-            app.logger.info(
+            current_app.logger.info(
                 f"deleted department id {department.id} by user {current_user.id}"
             )
         except Exception as e:
@@ -109,11 +114,11 @@ def delete_department(_id):
             db.session.rollback()
     else:
         flash(f"Error deleting department with id {str(department.id)}", "danger")
-        return redirect(url_for("list_departments"))
-    return redirect(url_for("list_departments"))
+        return redirect(url_for("department.list_departments"))
+    return redirect(url_for("department.list_departments"))
 
 
-@app.route("/edit_department/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/edit_department/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
 @roles_required("superadmin")
 def edit_department(_id):
@@ -123,7 +128,7 @@ def edit_department(_id):
     department = db.session.query(Departments).filter(Departments.id == _id).first()
     if not department:
         flash("Not existing department", "danger")
-        return redirect(url_for("list_departments"))
+        return redirect(url_for("department.list_departments"))
 
     try:
         if form.validate_on_submit():
@@ -149,10 +154,10 @@ def edit_department(_id):
                 department.short_name = form.short_name.data
                 db.session.commit()
                 flash("Your changes have been saved.")
-                app.logger.info(
+                current_app.logger.info(
                     f"Department {department.id} updated by user {current_user.id}: name={department.name}, short_name={department.short_name}"
                 )
-                return redirect(url_for("list_departments"))
+                return redirect(url_for("department.list_departments"))
             except Exception as e:
                 flash(f"Error editing {department.id} with error {str(e)}", "danger")
                 db.session.rollback()
@@ -178,4 +183,4 @@ def edit_department(_id):
         return render_template(
             "edit_department.html", title="Edit Department", _id=_id, form=form
         )
-    return redirect(url_for("list_departments"))
+    return redirect(url_for("department.list_departments"))
@@ -0,0 +1,183 @@
+import json
+import logging
+import threading
+import time
+
+from flask import Blueprint, current_app, g, has_request_context, render_template, request
+from flask_security import auth_required, current_user, roles_required
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import metrics
+
+# Time spent in the database by each request.
+#
+# Every statement run on an engine during a request is counted and timed;
+# when the request ends its totals are
+#   sent as a Server-Timing header: db;dur=12.5;desc="7 statements", app;dur=40.1
+#   (shown by the browser developer tools, under Timing), to the
+#   superadmins only unless SERVER_TIMING is set
+#   logged as one json line on the "reagentario.requests" logger, at INFO,
+#   or WARNING when slower than SLOW_REQUEST_MS or running more than
+#   SLOW_REQUEST_STATEMENTS statements (set REQUEST_LOG_LEVEL to "INFO"
+#   to log them all)
+#   added to the per endpoint summary of /diagnostics (superadmin), kept
+#   by each worker process since it started
+# An N+1 query shows up as a statement count growing with the page size.
+
+SLOW_REQUEST_MS = 500
+SLOW_REQUEST_STATEMENTS = 50
+SLOWEST_KEPT = 50
+STATEMENT_LENGTH = 500
+
+logger = logging.getLogger("reagentario.requests")
+
+bp = Blueprint("diagnostics", __name__)
+
+_lock = threading.Lock()
+_endpoints = {}
+_slowest = []
+_started = time.time()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["statement_start"].pop()
+    if not has_request_context() or "sql_timing" not in g:
+        return
+    timing = g.sql_timing
+    timing["statements"] += 1
+    timing["time"] += duration
+    if duration > timing["slowest_time"]:
+        timing["slowest_time"] = duration
+        timing["slowest"] = statement
+
+
+@event.listens_for(Engine, "handle_error")
+def _failed_statement(context):
+    if context.connection is not None and context.connection.info.get("statement_start"):
+        context.connection.info["statement_start"].pop()
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.sql_timing = {"statements": 0, "time": 0.0, "slowest_time": 0.0, "slowest": None}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def _record(entry):
+    with _lock:
+        totals = _endpoints.setdefault(entry["endpoint"], {
+            "requests": 0,
+            "time": 0.0,
+            "max_time": 0.0,
+            "statements": 0,
+            "max_statements": 0,
+            "db_time": 0.0,
+            "slowest_time": 0.0,
+            "slowest": None,
+        })
+        totals["requests"] += 1
+        totals["time"] += entry["duration_ms"]
+        totals["max_time"] = max(totals["max_time"], entry["duration_ms"])
+        totals["statements"] += entry["statements"]
+        totals["max_statements"] = max(totals["max_statements"], entry["statements"])
+        totals["db_time"] += entry["db_ms"]
+        if entry["slowest_ms"] > totals["slowest_time"]:
+            totals["slowest_time"] = entry["slowest_ms"]
+            totals["slowest"] = entry["slowest"]
+        _slowest.append(entry)
+        _slowest.sort(key=lambda e: e["duration_ms"], reverse=True)
+        del _slowest[SLOWEST_KEPT:]
+
+
+def _send_timing(config):
+    # the timings tell how the queries of a page behave, not for everyone
+    if config.get("SERVER_TIMING", False):
+        return True
+    return current_user.is_authenticated and current_user.has_role("superadmin")
+
+
+def _end_request(response):
+    timing = g.pop("sql_timing", None)
+    if timing is None:
+        return response
+    duration = time.perf_counter() - g.pop("request_start")
+    config = current_app.config
+    if _send_timing(config):
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={_ms(timing["time"])};desc="{timing["statements"]} statements", '
+            f"app;dur={_ms(duration - timing['time'])}",
+        )
+    slowest = timing["slowest"]
+    entry = {
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "duration_ms": _ms(duration),
+        "statements": timing["statements"],
+        "db_ms": _ms(timing["time"]),
+        "slowest_ms": _ms(timing["slowest_time"]),
+        "slowest": " ".join(slowest.split())[:STATEMENT_LENGTH] if slowest else None,
+    }
+    slow = (
+        entry["duration_ms"] > config.get("SLOW_REQUEST_MS", SLOW_REQUEST_MS)
+        or entry["statements"] > config.get("SLOW_REQUEST_STATEMENTS", SLOW_REQUEST_STATEMENTS)
+    )
+    logger.log(logging.WARNING if slow else logging.INFO, json.dumps(entry))
+    _record(entry)
+    metrics.observe_request(entry)
+    return response
+
+
+def init_app(app):
+    """time the requests of app; call before registering the other
+    after_request functions, so their statements are counted too"""
+    logger.setLevel(app.config.get("REQUEST_LOG_LEVEL", "WARNING"))
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+    app.register_blueprint(bp)
+
+
+@bp.route("/diagnostics")
+@auth_required()
+@roles_required("superadmin")
+def diagnostics():
+    """statements and database time per endpoint, in this worker process"""
+    with _lock:
+        endpoints = sorted(
+            (
+                {
+                    "endpoint": endpoint,
+                    "requests": t["requests"],
+                    "mean_ms": t["time"] / t["requests"],
+                    "max_ms": t["max_time"],
+                    "mean_statements": t["statements"] / t["requests"],
+                    "max_statements": t["max_statements"],
+                    "mean_db_ms": t["db_time"] / t["requests"],
+                    "slowest_ms": t["slowest_time"],
+                    "slowest": t["slowest"],
+                }
+                for endpoint, t in _endpoints.items()
+            ),
+            key=lambda e: e["mean_db_ms"] * e["requests"],
+            reverse=True,
+        )
+        slowest = list(_slowest)
+    return render_template(
+        "diagnostics.html",
+        title="Diagnostics",
+        endpoints=endpoints,
+        slowest=slowest,
+        since=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(_started)),
+    )
@@ -1,17 +1,18 @@
 from flask import (
+      Blueprint,
       render_template,
   )
 
-from app import app
+bp = Blueprint("errors", __name__)
 
 # Handling error 404 and displaying relevant web page
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template("error.html", error_code=404, error_message="Not Found"), 404
 
 
 # Handling error 500 and displaying relevant web page
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return (
         render_template(
@@ -22,7 +23,7 @@ def internal_error(error):
 
 
 # Handling error 400 and displaying relevant web page
-@app.errorhandler(400)
+@bp.app_errorhandler(400)
 def bad_request_error(error):
     return (
         render_template("error.html", error_code=400, error_message="Bad request"),
@@ -31,7 +32,7 @@ def bad_request_error(error):
 
 
 # Handling error 401 and displaying relevant web page
-@app.errorhandler(401)
+@bp.app_errorhandler(401)
 def not_auth_error(error):
     return (
         render_template("error.html", error_code=401, error_message="Unauthorized"),
@@ -0,0 +1,82 @@
+import csv
+import io
+import zlib
+
+from flask import Response, request, stream_with_context
+
+from app import db
+from app.metrics import count_export
+
+# rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 1000
+
+COMPRESSIONS = {
+    # name: (file suffix, mimetype)
+    "gzip": (".gz", "application/gzip"),
+    "zstd": (".zst", "application/zstd"),
+}
+
+
+def csv_chunks(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """yield the csv text of header and rows, chunk_size rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=",")
+    writer.writerow(header)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if n % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _compressor(compression):
+    if compression == "gzip":
+        return zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    if compression == "zstd":
+        # only loaded by the exports asking for it
+        import zstandard
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+
+def encode_chunks(chunks, compression=None):
+    """utf-8 encode chunks of text, optionally compressing the stream"""
+    compressor = _compressor(compression)
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def stream_query(statement, chunk_size=EXPORT_CHUNK_SIZE):
+    """iterate the rows of a select, reading them chunk_size at a time
+    (with a server side cursor where the driver supports it)"""
+    return db.session.execute(
+        statement.execution_options(yield_per=chunk_size)
+    )
+
+
+def csv_response(filename, header, rows, compression=None):
+    """stream rows as a csv attachment without building it in memory or on disk
+
+    compression: None, "gzip" or "zstd"
+    """
+    mimetype = "text/csv"
+    if compression in COMPRESSIONS:
+        suffix, mimetype = COMPRESSIONS[compression]
+        filename += suffix
+    else:
+        compression = None
+    body = encode_chunks(csv_chunks(header, rows), compression)
+    count_export(request.endpoint)
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
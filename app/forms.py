@@ -1,6 +1,7 @@
-from app import app
 from app import db
 from app.models import Inventory, Locations, Departments, User
+from app.versions import data_version
+from sqlalchemy import select
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField, PasswordField, BooleanField, SubmitField, SelectField, IntegerField, ValidationError, DateField
 from wtforms.validators import DataRequired, InputRequired, NumberRange, Email, EqualTo, Length
@@ -12,32 +13,51 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Sign In')
 
 
-class LocationField(SelectField):
-    def iter_choices(self):
-        locations = [("", "")]
-        locations += [(l.id, l.name) for l in Locations.query.all()]
-        for value, label in locations:
-            yield (value, label, self.coerce(value) == self.data)
-    def pre_validate(self, form):
-        for v, _ in [(l.id, l.name) for l in Locations.query.all()]:
-            if self.data == v:
-                break
-            else:
-                raise ValueError(self.gettext('Not a valid choice'))
+# choices of the location and department fields, cached per process and
+# database, and reloaded when the version of their table changes
+_choices = {}
+
+
+def _cached_choices(model):
+    version = data_version(model.__tablename__)
+    key = (db.engine.url, model)
+    cached = _choices.get(key)
+    if cached is None or cached[0] != version:
+        rows = db.session.execute(select(model.id, model.name).order_by(model.id)).all()
+        cached = (version, [(r.id, r.name) for r in rows], frozenset(str(r.id) for r in rows))
+        _choices[key] = cached
+    return cached
+
+
+def location_choices():
+    """[(id, name)] of all the locations"""
+    return _cached_choices(Locations)[1]
+
 
+def department_choices():
+    """[(id, name)] of all the departments"""
+    return _cached_choices(Departments)[1]
+
+
+class CachedChoicesField(SelectField):
+    model = None
 
-class DepartmentField(SelectField):
     def iter_choices(self):
-        departments = [("", "")]
-        departments += [(l.id, l.name) for l in Departments.query.all()]
-        for value, label in departments:
+        yield ("", "", self.coerce("") == self.data)
+        for value, label in _cached_choices(self.model)[1]:
             yield (value, label, self.coerce(value) == self.data)
+
     def pre_validate(self, form):
-        for v, _ in [(l.id, l.name) for l in Departments.query.all()]:
-            if self.data == v:
-                break
-            else:
-                raise ValueError(self.gettext('Not a valid choice'))
+        if str(self.data) not in _cached_choices(self.model)[2]:
+            raise ValueError(self.gettext('Not a valid choice'))
+
+
+class LocationField(CachedChoicesField):
+    model = Locations
+
+
+class DepartmentField(CachedChoicesField):
+    model = Departments
 
 
 class CreateForm(FlaskForm):
@@ -70,7 +90,7 @@ class CreateCalibrationForm(FlaskForm):
     description = StringField('Description', validators=[Length(min=0, max=256)])
     department = DepartmentField('Department',  validators=[InputRequired()])
     initial_check_date = DateField('Initial Check Date', validators=[InputRequired()])
-    frequency = IntegerField('Frequency', validators=[DataRequired()])
+    frequency = IntegerField('Frequency', validators=[DataRequired(), NumberRange(min=1)])
     frequency_units = SelectField('Frequency Unit', choices=[
         ('days', 'Days'),
         ('weeks', 'Weeks'),
@@ -120,7 +140,7 @@ class EditCalibrationForm(FlaskForm):
     description = StringField('Description', validators=[Length(min=0, max=256)])
     department = SelectField('Department',  validators=[InputRequired()], coerce=int)
     initial_check_date = DateField('Initial Check Date', validators=[InputRequired()])
-    frequency = IntegerField('Frequency', validators=[DataRequired()])
+    frequency = IntegerField('Frequency', validators=[DataRequired(), NumberRange(min=1)])
     frequency_units = SelectField('Frequency Unit', choices=[
         ('days', 'Days'),
         ('weeks', 'Weeks'),
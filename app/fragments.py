@@ -0,0 +1,101 @@
+from datetime import date
+
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from app.metrics import count_cache
+from app.models import Calibrations, Inventory
+from app.pagecache import MemoryStore
+from app.versions import data_version, deletions
+
+# Rendered rows of the long tables, cached in each worker process.
+#
+# The rows of list.html, list_calibrations.html and show_log.html are
+# rendered from the row_*.html templates by render_rows, which keeps each
+# rendered row under (template, row id, row key). The row key is the
+# version column of the row, incremented by every update, plus what the
+# row shows from other tables. A page render then joins cached rows and
+# renders only those that changed since.
+#
+# A deleted row's id can be given to a new row (SQLite reuses the highest
+# one, MySQL may after a restart), whose version starts over. The row keys
+# also carry the deletions of the table, so a delete drops the cached rows
+# of the table in every worker; deletes are rare next to updates.
+
+ROW_CACHE_SIZE = 20000
+
+_row_keys = {}
+
+
+def row_template(name):
+    """register the row key function of a row template"""
+
+    def decorator(func):
+        _row_keys[name] = func
+        return func
+
+    return decorator
+
+
+@row_template("row_reagent.html")
+def _reagent_key(reagent):
+    return reagent.version, deletions("inventory"), data_version("locations")
+
+
+@row_template("row_calibration.html")
+def _calibration_key(calibration):
+    # the colour of the row depends on the day
+    return calibration.version, deletions("calibrations"), data_version("departments"), date.today()
+
+
+@row_template("row_log.html")
+def _log_key(log):
+    # log rows are never changed, the reagent and user they show are
+    product = log.product
+    user = log.user
+    return (
+        deletions("applog"),
+        product.version if product is not None else None,
+        deletions("inventory"),
+        data_version("locations"),
+        user.username if user is not None else None,
+    )
+
+
+def _row_cache():
+    app = current_app._get_current_object()
+    cache = app.extensions.get("row_cache")
+    if cache is None:
+        cache = MemoryStore(app.config.get("ROW_CACHE_SIZE", ROW_CACHE_SIZE))
+        app.extensions["row_cache"] = cache
+    return cache
+
+
+def render_rows(name, items, var):
+    """rendered rows of the template name, one per item (passed as var)"""
+    template = current_app.jinja_env.get_template(name)
+    row_key = _row_keys[name]
+    cache = _row_cache()
+    rows = []
+    misses = 0
+    for item in items:
+        key = (name, item.id, row_key(item))
+        row = cache.get(key)
+        if row is None:
+            row = template.render({var: item})
+            cache.set(key, row)
+            misses += 1
+        rows.append(row)
+    count_cache("row", hits=len(rows) - misses, misses=misses)
+    return Markup("".join(rows))
+
+
+@event.listens_for(Inventory, "before_update")
+@event.listens_for(Calibrations, "before_update")
+def _bump_row_version(mapper, connection, target):
+    # the flush also calls this for rows without net changes;
+    # incremented by the database, concurrent updates get distinct versions
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = type(target).version + 1
@@ -5,55 +5,204 @@ from datetime import (
 )
 
 from dateutil.relativedelta import relativedelta
+from sqlalchemy import event, update
 
 from app import db
-from .models import Applog, Inventory, User, CalibrationsLog, Calibrations
+from .models import Applog, Inventory, CalibrationsLog, Calibrations
+from .audit import log_event, write_events
 
 
-def add_log(product_id, user_id, event_detail):
-    now = datetime.now()
-    product = Inventory.query.filter(Inventory.id == product_id).first()
-    user = User.query.filter(User.id == user_id).first()
-    logdata = Applog(
-        product=product, user=user, event_time=now, event_detail=event_detail
+def add_log(product_id, user_id, event_detail, event_type=None, quantity_delta=None,
+            field_name=None, old_value=None, new_value=None):
+    """log a reagent event, written with the request's next commit"""
+    log_event(
+        Applog,
+        product_id=product_id,
+        user_id=user_id,
+        event_detail=event_detail,
+        event_type=event_type,
+        quantity_delta=quantity_delta,
+        field_name=field_name,
+        old_value=old_value,
+        new_value=new_value,
     )
-    db.session.add(logdata)
+
+
+def update_stock(product_id, user_id, values, conditions, event_detail, event_type,
+                 quantity_delta=None):
+    """change a reagent with one conditional UPDATE and log the event in the
+    same transaction
+
+    values: new column values, usually expressions such as Inventory.amount + 1
+    conditions: extra WHERE conditions, such as Inventory.amount > 0
+
+    The database applies the change atomically, so concurrent requests on
+    the same reagent cannot overwrite each other. Returns False (and writes
+    nothing) when the reagent does not exist or the conditions do not hold.
+    """
+    result = db.session.execute(
+        update(Inventory)
+        .where(Inventory.id == product_id, *conditions)
+        .values({**values, Inventory.version: Inventory.version + 1})
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        return False
+    write_events([(Applog, dict(
+        product_id=product_id,
+        user_id=user_id,
+        event_time=datetime.now(),
+        event_detail=event_detail,
+        event_type=event_type,
+        quantity_delta=quantity_delta,
+    ))])
     db.session.commit()
+    return True
 
 
 def add_calibration_log(calibration_id, user_id, event_detail):
-    now = datetime.now()
-    calibration = Calibrations.query.filter(Calibrations.id == calibration_id).first()
-    user = User.query.filter(User.id == user_id).first()
-    logdata = CalibrationsLog(
-        calibration=calibration, user=user, event_time=now, event_detail=event_detail
+    """log a calibration event, written with the request's next commit"""
+    log_event(
+        CalibrationsLog,
+        calibration_id=calibration_id,
+        user_id=user_id,
+        event_detail=event_detail,
     )
-    db.session.add(logdata)
-    db.session.commit()
 
 
-def calculate_next_calibration_date(_id):
-    calibration = db.session.query(Calibrations).filter(Calibrations.id == _id).first()
-    freq = int(calibration.frequency)
-    freq_units = str(calibration.frequency_units)
-    tolerance = int(calibration.tolerance)
-    tolerance_units = str(calibration.tolerance_units)
+def _as_date(value):
+    # the editing form hands the dates over as strings
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return value
+
+
+def next_calibration_date(initial, frequency, frequency_units, last, tolerance, tolerance_units):
+    """first date of the schedule initial + n * frequency (n >= 1) falling
+    after the last calibration date plus its tolerance
 
-    # se chiamata dal form di editing i campi ritornati sono tutte stringhe
-    if isinstance(calibration.initial_check_date, str):
-        initc = datetime.strptime(calibration.initial_check_date, "%Y-%m-%d").date()
-        lastc = datetime.strptime(calibration.last_calibration_date, "%Y-%m-%d").date()
+    Days and weeks are computed with integer division. Months and years
+    jump directly to the month count estimated from the calendar distance,
+    then correct it by at most a step or two, because adding months clamps
+    the day to the end of shorter months.
+    """
+    initial = _as_date(initial)
+    last = _as_date(last)
+    frequency = int(frequency)
+    if frequency <= 0:
+        raise ValueError("Calibration frequency must be a positive number")
+    threshold = calculate_relativedelta(last, str(tolerance_units), int(tolerance), n=1)
+
+    if frequency_units in ("days", "weeks"):
+        step = frequency * 7 if frequency_units == "weeks" else frequency
+        n = max(1, (threshold - initial).days // step + 1)
+        return initial + timedelta(days=n * step)
+
+    if frequency_units == "years":
+        step = frequency * 12
+    elif frequency_units == "months":
+        step = frequency
     else:
-        initc = calibration.initial_check_date
-        lastc = calibration.last_calibration_date
-    run = True
-    n = 0
-    while run:
+        raise ValueError(f"Invalid frequency unit {frequency_units}")
+    months = (threshold.year - initial.year) * 12 + threshold.month - initial.month
+    n = max(1, months // step)
+    while initial + relativedelta(months=n * step) <= threshold:
         n += 1
-        nextc = calculate_relativedelta(initc, freq_units, freq, n)
-        if nextc > calculate_relativedelta(lastc, tolerance_units, tolerance, n=1):
-            run = False
-    return nextc
+    while n > 1 and initial + relativedelta(months=(n - 1) * step) > threshold:
+        n -= 1
+    return initial + relativedelta(months=n * step)
+
+
+def calibration_next_date(calibration):
+    """next calibration date from the schedule of a Calibrations row"""
+    return next_calibration_date(
+        calibration.initial_check_date,
+        calibration.frequency,
+        calibration.frequency_units,
+        calibration.last_calibration_date,
+        calibration.tolerance,
+        calibration.tolerance_units,
+    )
+
+
+def reschedule_calibrations(calibrations, last_calibration_date, user_id, event_detail=None):
+    """set the last calibration date of many calibrations at once
+
+    The next and due dates of all of them are computed in memory, then
+    written with one bulk UPDATE by primary key and logged with one bulk
+    INSERT, in a single transaction: either every calibration is moved or
+    none is (the error is raised to the caller after the rollback).
+
+    event_detail: optional format string for the log, receives the
+    calibration and the new dates as keyword arguments
+    Returns a list of (calibration name, description, last, next) tuples.
+    """
+    last_calibration_date = _as_date(last_calibration_date)
+    if event_detail is None:
+        event_detail = "Set calibration date for {id} - {name} - {description} - {last}"
+    values = []
+    events = []
+    done = []
+    now = datetime.now()
+    for c in calibrations:
+        next_date = next_calibration_date(
+            c.initial_check_date, c.frequency, c.frequency_units,
+            last_calibration_date, c.tolerance, c.tolerance_units,
+        )
+        values.append({
+            "id": c.id,
+            "last_calibration_date": last_calibration_date,
+            "next_calibration_date": next_date,
+            "due_date": calibration_due_date(next_date, c.tolerance, c.tolerance_units),
+        })
+        events.append((CalibrationsLog, dict(
+            calibration_id=c.id,
+            user_id=user_id,
+            event_time=now,
+            event_detail=event_detail.format(
+                id=c.id, name=c.name, description=c.description,
+                last=last_calibration_date, next=next_date,
+            ),
+        )))
+        done.append((c.name, c.description, last_calibration_date, next_date))
+    if not values:
+        return done
+    try:
+        db.session.execute(update(Calibrations), values)
+        # row versions, see app.fragments
+        db.session.execute(
+            update(Calibrations)
+            .where(Calibrations.id.in_([v["id"] for v in values]))
+            .values(version=Calibrations.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        write_events(events)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return done
+
+
+def calibration_due_date(next_date, tolerance, tolerance_units):
+    """last day a calibration can be performed: next date plus tolerance"""
+    next_date = _as_date(next_date)
+    if next_date is None:
+        return None
+    return calculate_relativedelta(next_date, str(tolerance_units), int(tolerance or 0), n=1)
+
+
+@event.listens_for(Calibrations, "before_insert")
+@event.listens_for(Calibrations, "before_update")
+def _set_due_date(mapper, connection, calibration):
+    # keeps due_date current for every ORM write, views and admin alike;
+    # bulk UPDATE statements have to set it themselves
+    calibration.due_date = calibration_due_date(
+        calibration.next_calibration_date,
+        calibration.tolerance,
+        calibration.tolerance_units,
+    )
 
 
 def calculate_relativedelta(value, unit, increment, n):
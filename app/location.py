@@ -1,4 +1,6 @@
 from flask import (
+    Blueprint,
+    current_app,
     render_template,
     make_response,
     flash,
@@ -7,16 +9,17 @@ from flask import (
     request,
     session,
 )
-from app import app
 from app import db
-from app import log
 from app.forms import (
     CreateLocationForm,
     EditLocationForm,
+    department_choices,
 )
 from app.models import Inventory, Locations, Departments
 
 from app.functions import add_log
+from app.queries import permitted
+from app.pagecache import cached_page
 
 from sqlalchemy import inspect
 from sqlalchemy.exc import IntegrityError, PendingRollbackError
@@ -30,8 +33,12 @@ from flask_security import (
     UserMixin,
 )
 
-@app.route("/list_locations", methods=["GET"])
+bp = Blueprint("location", __name__)
+
+
+@bp.route("/list_locations", methods=["GET"])
 @auth_required()
+@cached_page("locations", "departments")
 def list_locations():
     """list all locations"""
     locations = Locations.query.all()
@@ -45,22 +52,21 @@ def list_locations():
     return render_template("list_locations.html", warning=msg, title="Locations")
 
 
-@app.route("/list_location_content/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/list_location_content/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
+@cached_page("locations")
 def list_location_content(_id):
     """list content of a location"""
-    reagents = Inventory.query.filter(Inventory.location_id == _id).all()
-    location = Locations.query.filter(Locations.id == _id).first()
-    loc_name = location.name
+    location = Locations.query.get_or_404(_id)
 
-    if len(reagents) > 0:
-        return render_template("list.html", title=loc_name, reagents=reagents)
-    flash("No Reagents Found!")
-    msg = "No Reagents Found in this location"
-    return render_template("list.html", title=loc_name, warning=msg)
+    return render_template(
+        "list.html",
+        title=location.name,
+        data_url=url_for("reagent.list_data", location_id=location.id),
+    )
 
 
-@app.route("/create_location", methods=["GET", "POST"])
+@bp.route("/create_location", methods=["GET", "POST"])
 @auth_required()
 @roles_required("admin")
 def create_location():
@@ -73,7 +79,7 @@ def create_location():
         short_name = request.form["short_name"]
         department = Departments.query.get_or_404(form.department.data)
 
-        if not current_user.has_role(department.short_name):
+        if not permitted(department.id):
             flash(
                 f"You have not permission to create a location for {department}",
                 "danger",
@@ -99,13 +105,13 @@ def create_location():
         db.session.add(location)
         db.session.commit()
         db.session.refresh(location)
-        app.logger.info(f"created location id {location.id} (name: {location.name}) by user id {current_user.id} (email: {current_user.email})")
+        current_app.logger.info(f"created location id {location.id} (name: {location.name}) by user id {current_user.id} (email: {current_user.email})")
 
-        return redirect(url_for("list_locations"))
+        return redirect(url_for("location.list_locations"))
     return render_template("create_location.html", form=form, title="Add a new location")
 
 
-@app.route("/delete_location/<int:_id>/", methods=["GET"])
+@bp.route("/delete_location/<int:_id>/", methods=["GET"])
 @auth_required()
 @roles_required("admin")
 def delete_location(_id):
@@ -115,12 +121,12 @@ def delete_location(_id):
 
     if location:
 
-        if not current_user.has_role(location.department.short_name):
+        if not permitted(location.department_id):
             flash(
                 f"You have not permission to delete a location for {location.department.name}",
                 "danger",
             )
-            return redirect(url_for("list_locations"))
+            return redirect(url_for("location.list_locations"))
 
         reagents_in = Inventory.query.filter(Inventory.location_id == _id).all()
         if len(reagents_in) > 0:
@@ -128,27 +134,28 @@ def delete_location(_id):
                 f"Location {location.name} contains some reagents, it cannot be deleted",
                 "danger",
             )
-            return redirect(url_for("list_locations"))
+            return redirect(url_for("location.list_locations"))
         try:
-            db.session.delete(location)
-            db.session.commit()
             add_log(
-                location.id,
+                None,
                 current_user.id,
                 f"deleted location {location.id} - {location.name}",
+                event_type="location_deleted",
             )
+            db.session.delete(location)
+            db.session.commit()
             flash(f"Location {location.name} deleted", "info")
-            app.logger.info(f"deleted location id {location.id} (name: {location.name}) by user id {current_user.id} (email: {current_user.email})")
+            current_app.logger.info(f"deleted location id {location.id} (name: {location.name}) by user id {current_user.id} (email: {current_user.email})")
         except Exception as e:
             flash(f"Error deleting location {location.name} with error {str(e)}", "danger")
             db.session.rollback()
     else:
         flash(f"Error deleting location with id {str(location.id)}", "danger")
-        return redirect(url_for("list_locations"))
-    return redirect(url_for("list_locations"))
+        return redirect(url_for("location.list_locations"))
+    return redirect(url_for("location.list_locations"))
 
 
-@app.route("/edit_location/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/edit_location/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
 @roles_required("admin")
 def edit_location(_id):
@@ -157,16 +164,16 @@ def edit_location(_id):
         loc = db.session.query(Locations).filter(Locations.id == _id).first()
         if not loc:
             flash("Not existing location", "danger")
-            return redirect(url_for("list_locations"))
+            return redirect(url_for("location.list_locations"))
 
-        if not current_user.has_role(loc.department.short_name):
+        if not permitted(loc.department_id):
             flash(
                 f"You have not permission to edit a location for {loc.department.name}",
                 "danger",
             )
-            return redirect(url_for("list_locations"))
+            return redirect(url_for("location.list_locations"))
 
-        dept = [(dept.id, dept.name) for dept in Departments.query.all()]
+        dept = department_choices()
         form = EditLocationForm(csrf_enabled=False, exclude_fk=False, obj=loc)
         form.department.choices = dept
         form.department.data = loc.department.id
@@ -206,7 +213,7 @@ def edit_location(_id):
 
                 for key in common_keys:
                     if str(l1[key]) != str(l2[key]):
-                        app.logger.info(
+                        current_app.logger.info(
                             loc.id,
                             current_user.id,
                             f'updated item {loc.id} - {loc.name}: {key} value changed from "{str(l1[key])}" to "{str(l2[key])}" by user {current_user.id}',
@@ -218,7 +225,7 @@ def edit_location(_id):
                     "edit_location.html", title="Edit Location", _id=_id, form=form
                 )
 
-            return redirect(url_for("list_locations"))
+            return redirect(url_for("location.list_locations"))
 
         return render_template("edit_location.html", _id=_id, form=form, title="Edit location")
 
@@ -0,0 +1,189 @@
+import json
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, or_, select
+
+from app import db
+from app.archive import archived_logs, newest_archived
+from app.models import Applog, CalibrationsLog, User
+
+# Audit logs (applog and calibrationlog) are read one page at a time,
+# newest first. The next page starts after the (event_time, id) of the last
+# row of the previous one (keyset pagination): every page is an index range
+# scan, however far back it is, where an OFFSET would read and skip all
+# the newer rows. No total is counted for the same reason.
+# Rows moved to the archive (app.archive) follow the dated rows of the
+# table, and are read only when a page reaches back to them.
+
+LOG_PAGE_SIZE = 100
+MAX_LOG_PAGE_SIZE = 1000
+
+# values of Applog.event_type
+EVENT_TYPES = (
+    "created",
+    "updated",
+    "deleted",
+    "added",
+    "removed",
+    "moved",
+    "added_warehouse",
+    "ordered",
+    "order_reset",
+    "location_deleted",
+    "department_deleted",
+)
+
+# the column of the logged product or calibration
+SUBJECT = {
+    Applog: Applog.product_id,
+    CalibrationsLog: CalibrationsLog.calibration_id,
+}
+
+
+def _date_arg(args, key):
+    try:
+        return date.fromisoformat(args.get(key, ""))
+    except ValueError:
+        return None
+
+
+def log_filters(model, args, subject_id=None):
+    """the filters of a log request, as {argument: value} of the valid ones
+
+    from, to: first and last day (YYYY-MM-DD)
+    user: user name
+    subject: product (applog) or calibration (calibrationlog) id
+    event_type: one of EVENT_TYPES, applog only
+    """
+    filters = {}
+    for key in ("from", "to"):
+        value = _date_arg(args, key)
+        if value is not None:
+            filters[key] = value
+    user = args.get("user", "").strip()
+    if user:
+        filters["user"] = user
+    if subject_id is None:
+        subject_id = args.get("subject", type=int)
+    if subject_id:
+        filters["subject"] = subject_id
+    if model is Applog and args.get("event_type") in EVENT_TYPES:
+        filters["event_type"] = args["event_type"]
+    return filters
+
+
+def log_conditions(model, filters):
+    """WHERE conditions of filters (see log_filters)"""
+    conditions = []
+    if "from" in filters:
+        conditions.append(model.event_time >= datetime.combine(filters["from"], datetime.min.time()))
+    if "to" in filters:
+        end = filters["to"] + timedelta(days=1)
+        conditions.append(model.event_time < datetime.combine(end, datetime.min.time()))
+    if "user" in filters:
+        # user names are unique, an equality keeps the (user_id, event_time) order
+        user_id = select(User.id).where(User.username == filters["user"]).scalar_subquery()
+        conditions.append(model.user_id == user_id)
+    if "subject" in filters:
+        conditions.append(SUBJECT[model] == filters["subject"])
+    if "event_type" in filters:
+        conditions.append(model.event_type == filters["event_type"])
+    return conditions
+
+
+def encode_cursor(row):
+    event_time = row.event_time.isoformat() if row.event_time is not None else None
+    return json.dumps([event_time, row.id])
+
+
+def decode_cursor(raw):
+    """(event_time, id) of a cursor, None if it is not valid"""
+    if not raw:
+        return None
+    try:
+        event_time, last_id = json.loads(raw)
+        if event_time is not None:
+            event_time = datetime.fromisoformat(event_time)
+        return event_time, int(last_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _after(model, cursor):
+    # the leading event_time <= t bounds the index range scan, an OR of
+    # the two cases alone is not used as a range by every planner
+    event_time, last_id = cursor
+    return and_(
+        model.event_time <= event_time,
+        or_(model.event_time < event_time, model.id < last_id),
+    )
+
+
+def log_page(model, filters, after=None, length=LOG_PAGE_SIZE, options=()):
+    """one page of log rows matching filters, newest first
+
+    after: cursor of the last row of the previous page
+    Returns the rows and the cursor of the next page (None on the last one).
+    """
+    length = max(1, min(length or LOG_PAGE_SIZE, MAX_LOG_PAGE_SIZE))
+    query = (
+        select(model)
+        .where(*log_conditions(model, filters))
+        .order_by(model.event_time.desc(), model.id.desc())
+        .options(*options)
+    )
+    cursor = decode_cursor(after)
+    rows = []
+    # one more row than asked tells whether there is a next page
+    if cursor is None or cursor[0] is not None:
+        timed = query.where(model.event_time.is_not(None))
+        if cursor is not None:
+            timed = timed.where(_after(model, cursor))
+        rows = db.session.scalars(timed.limit(length + 1)).unique().all()
+        newest = newest_archived(model)
+        if newest is not None and (len(rows) <= length or rows[-1].event_time <= newest):
+            # merged, as rows logged late for an archived month stay in the table
+            rows += archived_logs(model, filters, cursor, length + 1)
+            rows.sort(key=lambda log: (log.event_time, log.id), reverse=True)
+            rows = rows[:length + 1]
+    # rows without event_time (older than the event columns) come last
+    if len(rows) <= length and "from" not in filters and "to" not in filters:
+        untimed = query.where(model.event_time.is_(None))
+        if cursor is not None and cursor[0] is None:
+            untimed = untimed.where(model.id < cursor[1])
+        rows += db.session.scalars(untimed.limit(length + 1 - len(rows))).unique().all()
+    if len(rows) > length:
+        rows = rows[:length]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def applog_row(log):
+    """json of an applog row"""
+    product = log.product
+    return {
+        "id": log.id,
+        "event_time": log.event_time.isoformat() if log.event_time else None,
+        "product_id": log.product_id,
+        "product": product.name if product is not None else None,
+        "user": log.user.username if log.user is not None else None,
+        "event_type": log.event_type,
+        "quantity_delta": log.quantity_delta,
+        "field_name": log.field_name,
+        "old_value": log.old_value,
+        "new_value": log.new_value,
+        "detail": log.event_detail,
+    }
+
+
+def calibrationlog_row(log):
+    """json of a calibrationlog row"""
+    calibration = log.calibration
+    return {
+        "id": log.id,
+        "event_time": log.event_time.isoformat() if log.event_time else None,
+        "calibration_id": log.calibration_id,
+        "calibration": calibration.name if calibration is not None else None,
+        "user": log.user.username if log.user is not None else None,
+        "detail": log.event_detail,
+    }
@@ -0,0 +1,201 @@
+import hmac
+import os
+import shutil
+import threading
+
+from flask import Blueprint, Response, abort, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import db
+from app.config import Config
+
+# Prometheus metrics, served on /metrics:
+#   reagentario_request_duration_seconds   histogram by endpoint and method
+#   reagentario_requests_total             by endpoint, method and status
+#   reagentario_db_statements_total        statements run, by endpoint
+#   reagentario_db_seconds_total           time spent in them, by endpoint
+#   reagentario_db_pool_size, _checked_out, _overflow
+#                                          connection pools, summed over workers
+#   reagentario_db_pre_ping_failures_total pooled connections found dead
+#   reagentario_cache_lookups_total        by cache (page, data, row) and
+#                                          result (hit, miss, not_modified)
+#   reagentario_inventory_events_total     log events by event_type (added,
+#                                          removed, moved, ...)
+#   reagentario_exports_total              csv exports by endpoint
+# A hit ratio is then, for instance,
+#   sum(rate(reagentario_cache_lookups_total{cache="row",result="hit"}[5m]))
+#     / sum(rate(reagentario_cache_lookups_total{cache="row"}[5m]))
+#
+# Under gunicorn each worker process keeps its own values; to serve the
+# sum of all of them, set METRICS_DIR (or PROMETHEUS_MULTIPROC_DIR) to a
+# directory the workers share, and in gunicorn.conf.py:
+#   from app.metrics import gunicorn_on_starting as on_starting
+#   from app.metrics import gunicorn_child_exit as child_exit
+# which empty the directory when gunicorn starts and drop the pool gauges
+# of the workers that exit.
+# Needs prometheus_client, without it there is no /metrics.
+#
+# Disabled unless METRICS is set, and then only served to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>": without a token there is no
+# /metrics either, the endpoint names and counts are not public.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+bp = Blueprint("metrics", __name__)
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _create():
+    # imported once the multiprocess directory is known: the module picks
+    # the way it stores values when it is imported
+    from prometheus_client import Counter, Gauge, Histogram
+
+    return {
+        "duration": Histogram(
+            "reagentario_request_duration_seconds", "Request duration",
+            ["endpoint", "method"], buckets=DURATION_BUCKETS,
+        ),
+        "requests": Counter(
+            "reagentario_requests", "Requests served", ["endpoint", "method", "status"]
+        ),
+        "statements": Counter(
+            "reagentario_db_statements", "SQL statements run", ["endpoint"]
+        ),
+        "db_time": Counter(
+            "reagentario_db_seconds", "Time spent running SQL statements", ["endpoint"]
+        ),
+        "pool_size": Gauge(
+            "reagentario_db_pool_size", "Connections kept by the pools", multiprocess_mode="livesum"
+        ),
+        "pool_checked_out": Gauge(
+            "reagentario_db_pool_checked_out", "Connections in use", multiprocess_mode="livesum"
+        ),
+        "pool_overflow": Gauge(
+            "reagentario_db_pool_overflow", "Connections open beyond the pool size",
+            multiprocess_mode="livesum",
+        ),
+        "pre_ping_failures": Counter(
+            "reagentario_db_pre_ping_failures", "Pooled connections found dead by the pre ping"
+        ),
+        "cache": Counter(
+            "reagentario_cache_lookups", "Cache lookups", ["cache", "result"]
+        ),
+        "inventory_events": Counter(
+            "reagentario_inventory_events", "Inventory log events", ["event_type"]
+        ),
+        "exports": Counter(
+            "reagentario_exports", "CSV exports", ["export"]
+        ),
+    }
+
+
+def init_app(app):
+    """collect the metrics of app and serve them on /metrics"""
+    if not app.config.get("METRICS", False):
+        return
+    if not app.config.get("METRICS_TOKEN"):
+        app.logger.warning("METRICS is set without METRICS_TOKEN, no /metrics")
+        return
+    directory = app.config.get("METRICS_DIR")
+    if directory and not os.environ.get(MULTIPROC_ENV):
+        os.makedirs(directory, exist_ok=True)
+        os.environ[MULTIPROC_ENV] = directory
+    with _metrics_lock:
+        # once per process, however many applications are created
+        if not _metrics:
+            try:
+                _metrics.update(_create())
+            except ImportError:
+                app.logger.warning("prometheus_client is not installed, no /metrics")
+                return
+    app.register_blueprint(bp)
+
+
+def observe_request(entry):
+    """record a request, entry as logged by app.diagnostics"""
+    if not _metrics:
+        return
+    endpoint = entry["endpoint"] or "none"
+    _metrics["duration"].labels(endpoint, entry["method"]).observe(entry["duration_ms"] / 1000)
+    _metrics["requests"].labels(endpoint, entry["method"], str(entry["status"])).inc()
+    if entry["statements"]:
+        _metrics["statements"].labels(endpoint).inc(entry["statements"])
+        _metrics["db_time"].labels(endpoint).inc(entry["db_ms"] / 1000)
+    pool = db.engine.pool
+    # QueuePool only, the other pools do not count their connections
+    if hasattr(pool, "checkedout"):
+        _metrics["pool_size"].set(pool.size())
+        _metrics["pool_checked_out"].set(pool.checkedout())
+        _metrics["pool_overflow"].set(max(pool.overflow(), 0))
+
+
+def count_cache(cache, hits=0, misses=0, not_modified=0):
+    if not _metrics:
+        return
+    for result, count in (("hit", hits), ("miss", misses), ("not_modified", not_modified)):
+        if count:
+            _metrics["cache"].labels(cache, result).inc(count)
+
+
+def count_inventory_event(event_type):
+    if _metrics:
+        _metrics["inventory_events"].labels(event_type or "none").inc()
+
+
+def count_export(export):
+    if _metrics:
+        _metrics["exports"].labels(export).inc()
+
+
+@event.listens_for(Engine, "handle_error")
+def _pre_ping_failure(context):
+    if _metrics and context.is_pre_ping:
+        _metrics["pre_ping_failures"].inc()
+
+
+@bp.route("/metrics")
+def metrics():
+    """the metrics, in the Prometheus text format"""
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    token = current_app.config["METRICS_TOKEN"]
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        abort(403)
+    if os.environ.get(MULTIPROC_ENV):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def _directory():
+    # the gunicorn master has no application to read the configuration of
+    return os.environ.get(MULTIPROC_ENV) or getattr(Config, "METRICS_DIR", None)
+
+
+def gunicorn_on_starting(server):
+    """gunicorn hook: empty the multiprocess directory of a previous run"""
+    directory = _directory()
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+def gunicorn_child_exit(server, worker):
+    """gunicorn hook: forget the live gauges of an exited worker"""
+    directory = _directory()
+    if directory:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid, directory)
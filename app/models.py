@@ -105,11 +105,22 @@ class Inventory(db.Model):
     size = db.Column(db.String(16))
     notes = db.Column(db.String(512))
     order = db.Column(db.Integer, default=0)
+    # incremented by every update, see app.fragments
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
         return self.name #'<Reagent {}>'.format(self.name)
 
 
+class InventorySearchToken(db.Model):
+    __tablename__ = 'inventory_search'
+    token = db.Column(db.String(64), primary_key=True)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+    def __repr__(self):
+        return self.token
+
+
 class Calibrations(db.Model):
     __tablename__ = 'calibrations'
     id = db.Column(db.Integer, primary_key=True)
@@ -125,7 +136,12 @@ class Calibrations(db.Model):
     tolerance_units = db.Column(Enum('days', 'weeks', 'months', 'years'), nullable=False, server_default="days")
     last_calibration_date = db.Column(db.Date)
     next_calibration_date = db.Column(db.Date)
+    # next_calibration_date plus the tolerance, maintained by
+    # app.functions on every insert and update
+    due_date = db.Column(db.Date, index=True)
     notes = db.Column(db.String(512))
+    # incremented by every update, see app.fragments
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
         return self.name
@@ -136,6 +152,13 @@ class Calibrations(db.Model):
 
 class Applog(db.Model):
     __tablename__ = 'applog'
+    __table_args__ = (
+        db.Index('ix_applog_product_id_event_time', 'product_id', 'event_time'),
+        db.Index('ix_applog_event_type_event_time', 'event_type', 'event_time'),
+        # log pages, newest first, see app.logs
+        db.Index('ix_applog_event_time_id', 'event_time', 'id'),
+        db.Index('ix_applog_user_id_event_time', 'user_id', 'event_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user = db.relationship('User', backref='user', lazy=True)
@@ -143,13 +166,50 @@ class Applog(db.Model):
     product = db.relationship('Inventory', backref='log', lazy=True)
     event_time = db.Column(db.DateTime)
     event_detail = db.Column(db.String(512))
+    # created, updated, deleted, added, removed, moved, added_warehouse,
+    # ordered, order_reset, location_deleted, department_deleted
+    event_type = db.Column(db.String(32))
+    # change of the total stock (lab + warehouse) caused by the event
+    quantity_delta = db.Column(db.Integer)
+    # for updated events: the changed field with its old and new value
+    field_name = db.Column(db.String(64))
+    old_value = db.Column(db.String(512))
+    new_value = db.Column(db.String(512))
 
     def __repr__(self):
         return self.event_detail
 
 
+class ConsumptionDaily(db.Model):
+    __tablename__ = 'consumption_daily'
+    product_id = db.Column(db.Integer, db.ForeignKey('inventory.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    consumed = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"{self.product_id} {self.day} {self.consumed}"
+
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    # table name, version incremented by every write to that table
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # UTC time of the last increment, for Last-Modified headers
+    changed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"{self.name} {self.version}"
+
+
 class CalibrationsLog(db.Model):
     __tablename__ = 'calibrationlog'
+    __table_args__ = (
+        # log pages, newest first, see app.logs
+        db.Index('ix_calibrationlog_event_time_id', 'event_time', 'id'),
+        db.Index('ix_calibrationlog_calibration_id_event_time', 'calibration_id', 'event_time'),
+        db.Index('ix_calibrationlog_user_id_event_time', 'user_id', 'event_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user = db.relationship('User', backref='user_i', lazy=True)
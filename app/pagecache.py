@@ -0,0 +1,351 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as day_start, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, message_flashed, request, session
+from flask_security import current_user
+
+from app.metrics import count_cache
+from app.queries import permitted_department_ids
+from app.versions import data_changed_at, data_versions
+
+# Whole page cache for the read mostly views.
+#
+# A page is stored gzip compressed under a key made of the endpoint, its
+# url and query string, the user (the navbar shows name and role menus),
+# the permitted departments, the day (calibration colours depend on it)
+# and the versions of the tables the view reads. Any write to one of those
+# tables changes its version, hence the key: stale pages are never looked
+# up again and simply age out of the store.
+#
+# PAGE_CACHE selects the store:
+#   "memory"      LRU in each worker process (default)
+#   "filesystem"  files in PAGE_CACHE_DIR, shared by the workers of a host
+#   "sqlite"      the PAGE_CACHE_PATH database, shared by the workers of a host
+#   None          disabled
+#
+# Independently of the store, the key is also the ETag of the page, so a
+# browser reloading an unchanged page gets a 304 after the version lookup,
+# before the view runs a query or renders a template.
+#
+# Flash messages are not part of the key: a page is neither cached nor
+# tagged when messages were pending before the view ran, or were flashed by
+# it. The tables declared by each view are checked against the statements
+# it runs by tests/test_pagecache.py.
+
+PAGE_CACHE_SIZE = 512
+VALUE_CACHE_SIZE = 256
+
+
+class MemoryStore:
+    def __init__(self, size=PAGE_CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class FileSystemStore:
+    def __init__(self, path, size=PAGE_CACHE_SIZE):
+        self.path = path
+        self.size = size
+        self.writes = 0
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.path, key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        tmp = os.path.join(self.path, f".{key}.{os.getpid()}.{threading.get_ident()}")
+        with open(tmp, "wb") as f:
+            f.write(value)
+        os.replace(tmp, os.path.join(self.path, key))
+        self.writes += 1
+        if self.writes % 64 == 0:
+            self.prune()
+
+    def prune(self):
+        """keep the size most recently written pages"""
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.startswith("."):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        entries.sort(reverse=True)
+        for _, path in entries[self.size:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.path):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class SQLiteStore:
+    def __init__(self, path, size=PAGE_CACHE_SIZE):
+        self.path = path
+        self.size = size
+        self.writes = 0
+        self.local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, value BLOB, stored REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS page_stored ON page (stored)")
+
+    def _connection(self):
+        # one connection per thread (and per process, after a fork)
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value FROM page WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO page (key, value, stored) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+        self.writes += 1
+        if self.writes % 64 == 0:
+            conn.execute(
+                "DELETE FROM page WHERE key NOT IN "
+                "(SELECT key FROM page ORDER BY stored DESC LIMIT ?)",
+                (self.size,),
+            )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM page")
+
+
+def page_store():
+    """the store configured for the current application, None if disabled"""
+    app = current_app._get_current_object()
+    store = app.extensions.get("page_cache")
+    if store is None:
+        kind = app.config.get("PAGE_CACHE", "memory")
+        size = app.config.get("PAGE_CACHE_SIZE", PAGE_CACHE_SIZE)
+        if kind == "memory":
+            store = MemoryStore(size)
+        elif kind == "filesystem":
+            store = FileSystemStore(app.config["PAGE_CACHE_DIR"], size)
+        elif kind == "sqlite":
+            store = SQLiteStore(app.config["PAGE_CACHE_PATH"], size)
+        else:
+            store = False
+        app.extensions["page_cache"] = store
+    return store or None
+
+
+def page_key(tables, kind="page", ignore_args=()):
+    versions = data_versions()
+    if current_user.is_authenticated:
+        user = (current_user.id, current_user.username, sorted(r.name for r in current_user.roles))
+    else:
+        user = None
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if k not in ignore_args)
+    parts = (
+        kind,
+        request.endpoint,
+        request.path,
+        args,
+        user,
+        sorted(permitted_department_ids()),
+        date.today().isoformat(),
+        [(t, versions.get(t, 0)) for t in tables],
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _pack(response):
+    body = gzip.compress(response.get_data(), compresslevel=6)
+    return response.mimetype.encode() + b"\n" + body
+
+
+def _unpack(value):
+    mimetype, _, body = value.partition(b"\n")
+    return mimetype.decode(), body
+
+
+def _compressed_response(mimetype, body):
+    if request.accept_encodings["gzip"]:
+        response = make_response(body)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = make_response(gzip.decompress(body))
+    response.mimetype = mimetype
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _last_modified(tables):
+    """Last-Modified of a page reading tables, None when it is not safe"""
+    # the last data change, or midnight as the day is part of the page
+    midnight = datetime.combine(date.today(), day_start()).astimezone(timezone.utc)
+    changed = data_changed_at(tables)
+    if changed is not None:
+        changed = max(changed.replace(tzinfo=timezone.utc), midnight)
+    else:
+        changed = midnight
+    # within the current second a later write could share the same
+    # Last-Modified, the ETag alone is sent then
+    if changed > datetime.now(timezone.utc) - timedelta(seconds=1):
+        return None
+    # HTTP dates have whole seconds
+    return changed.replace(microsecond=0)
+
+
+def _not_modified(etag, last_modified):
+    """the tag of the request matching the page, True when its date does,
+    None when the page was modified"""
+    if request.if_none_match:
+        # Flask-Compress appends the content coding to the tag, such as "key:br"
+        for tag in request.if_none_match.as_set():
+            if tag.partition(":")[0] == etag:
+                return tag
+        return None
+    since = request.if_modified_since
+    if last_modified is not None and since is not None and last_modified <= since:
+        return True
+    return None
+
+
+def _set_validators(response, etag, last_modified, encoding=None):
+    response.set_etag(f"{etag}:{encoding}" if encoding else etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # personal pages, browsers revalidate them on every use
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@message_flashed.connect
+def _flashed(app, message, category):
+    g.flashed = True
+
+
+def cached_page(*tables):
+    """cache the GET responses of a view reading tables (table names) and
+    answer conditional requests for them"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # pending flash messages are shown (and consumed) by the render
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+            key = etag = page_key(tables)
+            last_modified = _last_modified(tables)
+            matched = _not_modified(etag, last_modified)
+            if matched is not None:
+                count_cache("page", not_modified=1)
+                response = _set_validators(make_response("", 304), etag, last_modified)
+                if matched is not True:
+                    response.set_etag(matched)
+                return response
+            store = page_store()
+            value = store.get(key) if store is not None else None
+            if store is not None:
+                count_cache("page", hits=value is not None, misses=value is None)
+            if value is not None:
+                response = _compressed_response(*_unpack(value))
+                encoding = response.headers.get("Content-Encoding")
+                return _set_validators(response, etag, last_modified, encoding)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+                return response
+            if g.get("flashed"):
+                return response
+            if store is None:
+                # compressed later by Flask-Compress, which extends the ETag
+                return _set_validators(response, etag, last_modified)
+            value = _pack(response)
+            store.set(key, value)
+            if request.accept_encodings["gzip"]:
+                # already compressed, Flask-Compress leaves it as it is
+                response.set_data(_unpack(value)[1])
+                response.headers["Content-Encoding"] = "gzip"
+                return _set_validators(response, etag, last_modified, "gzip")
+            return _set_validators(response, etag, last_modified)
+
+        wrapper.page_tables = tables
+        return wrapper
+
+    return decorator
+
+
+def cached_data(tables, build, ignore_args=()):
+    """json serialisable result of build(), cached like a page of a view
+    reading tables; the query arguments in ignore_args are left out of the key
+    (such as the request counter of DataTables)"""
+    store = page_store()
+    if store is None:
+        return build()
+    key = page_key(tables, "data", ignore_args)
+    value = store.get(key)
+    count_cache("data", hits=value is not None, misses=value is None)
+    if value is not None:
+        return json.loads(gzip.decompress(value))
+    data = build()
+    store.set(key, gzip.compress(json.dumps(data).encode(), compresslevel=6))
+    return data
+
+
+def cached_value(tables, build, *parts):
+    """result of build(), kept by each worker process under parts and the
+    versions of tables, whether or not the page cache is enabled (such as
+    the row count of a table, read again only after a write to it)"""
+    app = current_app._get_current_object()
+    store = app.extensions.get("value_cache")
+    if store is None:
+        store = app.extensions["value_cache"] = MemoryStore(VALUE_CACHE_SIZE)
+    versions = data_versions()
+    key = (parts, tuple((t, versions.get(t, 0)) for t in tables))
+    value = store.get(key)
+    if value is None:
+        value = build()
+        store.set(key, value)
+    return value
@@ -0,0 +1,160 @@
+from datetime import date, datetime, timedelta
+
+import click
+from dateutil.relativedelta import relativedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from app import db
+
+# Monthly partitions of the log tables, MySQL (and MariaDB) only.
+#
+# With LOG_PARTITIONING set, the migration a8d2f5c9e1b7 partitions applog
+# and calibrationlog BY RANGE COLUMNS(event_time):
+#   pold     everything before the first month
+#   p202501  the rows of January 2025, VALUES LESS THAN ('2025-02-01')
+#   ...
+#   pmax     VALUES LESS THAN (MAXVALUE), kept empty
+# A date bounded query, such as a log page, then reads only the partitions
+# of its range. 'flask log-partitions' (run it monthly, or daily with the
+# archiver) splits pmax into the coming months and, past
+# LOG_RETENTION_DAYS, drops the expired months or exchanges them into
+# tables of their own (applog_p202401), instead of deleting rows.
+# Other backends have nothing to partition, the command says so and the
+# date bounded queries use the (event_time, id) indexes.
+
+PARTITIONED_TABLES = ("applog", "calibrationlog")
+MONTHS_AHEAD = 3
+LAST = "pmax"
+
+
+def supported(connection):
+    return connection.dialect.name in ("mysql", "mariadb")
+
+
+def partition_name(month):
+    return month.strftime("p%Y%m")
+
+
+def _month(value):
+    return date(value.year, value.month, 1)
+
+
+def _bound(description):
+    """the date of VALUES LESS THAN ('2025-02-01 00:00:00'), None for MAXVALUE"""
+    value = description.strip("'")
+    if value.upper() == "MAXVALUE":
+        return None
+    return datetime.fromisoformat(value).date()
+
+
+def table_partitions(connection, table):
+    """[(name, upper bound date or None)] of table, oldest first; empty if
+    the table is not partitioned"""
+    rows = connection.execute(
+        text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table "
+            "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+        ),
+        {"table": table},
+    ).all()
+    return [(name, _bound(description)) for name, description in rows]
+
+
+def future_partitions(partitions, until):
+    """[(name, upper bound)] of the monthly partitions missing up to the
+    month of until"""
+    bounds = [bound for _, bound in partitions if bound is not None]
+    month = max(bounds) if bounds else _month(date.today())
+    missing = []
+    while month <= _month(until):
+        missing.append((partition_name(month), month + relativedelta(months=1)))
+        month += relativedelta(months=1)
+    return missing
+
+
+def expired_partitions(partitions, before):
+    """names of the partitions holding only rows older than before"""
+    return [
+        name
+        for name, bound in partitions
+        if bound is not None and bound <= before and name != LAST
+    ]
+
+
+def add_partitions(connection, table, missing):
+    if not missing:
+        return
+    parts = ", ".join(
+        f"PARTITION {name} VALUES LESS THAN ('{bound.isoformat()}')" for name, bound in missing
+    )
+    connection.execute(
+        text(
+            f"ALTER TABLE {table} REORGANIZE PARTITION {LAST} INTO "
+            f"({parts}, PARTITION {LAST} VALUES LESS THAN (MAXVALUE))"
+        )
+    )
+
+
+def expire_partition(connection, table, name, mode):
+    """drop a partition, or move its rows to the table {table}_{name} first
+    (mode "exchange"), which is kept"""
+    if mode == "exchange":
+        archive = f"{table}_{name}"
+        connection.execute(text(f"CREATE TABLE {archive} LIKE {table}"))
+        connection.execute(text(f"ALTER TABLE {archive} REMOVE PARTITIONING"))
+        connection.execute(text(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive}"))
+    connection.execute(text(f"ALTER TABLE {table} DROP PARTITION {name}"))
+
+
+def maintain_partitions(months_ahead=MONTHS_AHEAD, expired="keep", retention_days=None):
+    """create the partitions of the coming months and expire the old ones;
+    returns {table: (added, expired)}, None if the backend cannot partition"""
+    if retention_days is None:
+        retention_days = current_app.config.get("LOG_RETENTION_DAYS")
+    done = {}
+    # partition DDL commits implicitly, one statement at a time
+    with db.engine.connect() as connection:
+        if not supported(connection):
+            return None
+        for table in PARTITIONED_TABLES:
+            partitions = table_partitions(connection, table)
+            if not partitions:
+                done[table] = None
+                continue
+            missing = future_partitions(
+                partitions, date.today() + relativedelta(months=months_ahead)
+            )
+            add_partitions(connection, table, missing)
+            old = []
+            if expired != "keep" and retention_days:
+                before = _month(date.today() - timedelta(days=retention_days))
+                old = expired_partitions(partitions, before)
+                for name in old:
+                    expire_partition(connection, table, name, expired)
+            done[table] = ([name for name, _ in missing], old)
+    return done
+
+
+@click.command("log-partitions")
+@click.option("--months-ahead", type=int, default=MONTHS_AHEAD, show_default=True,
+              help="Months to create partitions for.")
+@click.option("--expired", type=click.Choice(["keep", "drop", "exchange"]), default="keep",
+              show_default=True, help="What to do with the months past LOG_RETENTION_DAYS.")
+@with_appcontext
+def log_partitions_command(months_ahead, expired):
+    """Create the coming monthly partitions of the log tables, expire old ones."""
+    done = maintain_partitions(months_ahead, expired)
+    if done is None:
+        click.echo(f"{db.engine.dialect.name} does not partition tables, nothing to do")
+        return
+    for table, result in done.items():
+        if result is None:
+            click.echo(f"{table} is not partitioned: set LOG_PARTITIONING, then "
+                       "'flask db downgrade f6c0d4b2e8a5' and 'flask db upgrade'")
+            continue
+        added, old = result
+        click.echo(f"{table}: added {', '.join(added) or 'none'}; "
+                   f"expired ({expired}) {', '.join(old) or 'none'}")
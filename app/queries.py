@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+
+from flask import g
+from flask_security import current_user
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import Inventory, Locations, Departments, Calibrations, Applog, CalibrationsLog
+
+
+# loader options shared by the list and report views: the templates read
+# reagent.location.name and reagent.location.department.short_name for every
+# row, with the default lazy loading that is one SELECT per row and relation
+
+def reagent_options():
+    """load location and department of reagents in the same SELECT"""
+    return (joinedload(Inventory.location).joinedload(Locations.department),)
+
+
+def calibration_options():
+    """load the department of calibrations in the same SELECT"""
+    return (joinedload(Calibrations.department),)
+
+
+def applog_options():
+    """load product (with its location) and user of log rows in the same SELECT"""
+    return (
+        joinedload(Applog.product).joinedload(Inventory.location),
+        joinedload(Applog.user),
+    )
+
+
+def calibrationlog_options():
+    """load calibration (with its department) and user of log rows in the same SELECT"""
+    return (
+        joinedload(CalibrationsLog.calibration).joinedload(Calibrations.department),
+        joinedload(CalibrationsLog.user),
+    )
+
+
+# department permissions: a user may see and change the data of the
+# departments whose short name is one of their roles
+
+def permitted_department_ids():
+    """ids of the departments of the current user, looked up once per request"""
+    if "department_ids" not in g:
+        names = [r.name for r in current_user.roles] if current_user.is_authenticated else []
+        g.department_ids = frozenset(
+            db.session.scalars(
+                select(Departments.id).where(Departments.short_name.in_(names))
+            )
+        ) if names else frozenset()
+    return g.department_ids
+
+
+def permitted(department_id):
+    return department_id in permitted_department_ids()
+
+
+def permitted_reagents(query):
+    """restrict a query on Inventory to the departments of the current user"""
+    locations = select(Locations.id).where(
+        Locations.department_id.in_(permitted_department_ids())
+    )
+    return query.filter(Inventory.location_id.in_(locations))
+
+
+def permitted_calibrations(query):
+    """restrict a query on Calibrations to the departments of the current user"""
+    return query.filter(Calibrations.department_id.in_(permitted_department_ids()))
+
+
+def reagents_query():
+    return Inventory.query.options(*reagent_options())
+
+
+def calibrations_query():
+    return Calibrations.query.options(*calibration_options())
+
+
+def applog_query():
+    return Applog.query.options(*applog_options())
+
+
+# calibration deadlines of the current user, range scans on the indexed
+# Calibrations.due_date
+
+def calibrations_due_today():
+    return permitted_calibrations(calibrations_query()).filter(
+        Calibrations.due_date == date.today()
+    )
+
+
+def calibrations_due_within(days):
+    """due from today to today + days, the soonest first"""
+    today = date.today()
+    return (
+        permitted_calibrations(calibrations_query())
+        .filter(Calibrations.due_date.between(today, today + timedelta(days=days)))
+        .order_by(Calibrations.due_date)
+    )
+
+
+def calibrations_overdue():
+    """due date already passed, the oldest first"""
+    return (
+        permitted_calibrations(calibrations_query())
+        .filter(Calibrations.due_date < date.today())
+        .order_by(Calibrations.due_date)
+    )
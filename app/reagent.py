@@ -1,7 +1,6 @@
-import csv
-import os
-
 from flask import (
+    Blueprint,
+    current_app,
     render_template,
     make_response,
     flash,
@@ -9,20 +8,32 @@ from flask import (
     url_for,
     request,
     session,
-    send_file,
+    jsonify,
 )
-from app import app
 from app import db
-from app import log
 from app.forms import (
     CreateForm,
     SearchForm,
     EditForm,
+    location_choices,
+)
+from app.models import Inventory, Locations, Applog, User
+from app.functions import add_log, update_stock
+from app.datatables import server_side_response
+from app.queries import (
+    reagents_query,
+    applog_options,
+    permitted,
+    permitted_department_ids,
+    permitted_reagents,
 )
-from app.models import Inventory, Locations, Applog
-from app.functions import add_log
+from app.search import search, index_reagent, unindex_reagent
+from app.consumption import consumption_report, forget_consumption
+from app.export import csv_response, stream_query
+from app.logs import EVENT_TYPES, LOG_PAGE_SIZE, applog_row, log_filters, log_page
+from app.pagecache import cached_page, cached_data, cached_value
 
-from sqlalchemy import inspect
+from sqlalchemy import inspect, select
 from sqlalchemy.exc import IntegrityError, PendingRollbackError
 
 from flask_security import (
@@ -38,8 +49,12 @@ from datetime import (
     timedelta,
 )
 
-@app.route("/list", methods=["GET", "POST"])
+bp = Blueprint("reagent", __name__)
+
+
+@bp.route("/list", methods=["GET", "POST"])
 @auth_required()
+@cached_page("locations")
 def list():
     """list all reagents"""
     form = SearchForm(csrf_enabled=False)
@@ -49,34 +64,83 @@ def list():
         location = request.form[
             "location"
         ]  # Locations.query.get_or_404(form.location.data)
-        reagents = Inventory.query.filter(
-            db.and_(
-                Inventory.name.like("%" + name + "%"),
-                Inventory.location_id.like("%" + form.location.data + "%"),
-            )
-        ).all()
+        reagents = search(reagents_query(), name)
+        location_id = request.form.get("location", type=int)
+        if location_id is not None:
+            reagents = reagents.filter(Inventory.location_id == location_id)
+        reagents = reagents.order_by(Inventory.name).all()
         msg = location
         return render_template("list.html", form=form, reagents=reagents, warning=msg)
 
-    if request.method == "GET":
-        reagents = Inventory.query.all()
+    # rows are fetched one page at a time by the table through list_data
+    return render_template("list.html", form=form, data_url=url_for("reagent.list_data"))
 
-    if len(reagents) > 0:
-        return render_template("list.html", form=form, reagents=reagents)
-    flash("No Reagents Found!")
-    msg = "No Reagents Found"
-    return render_template("list.html", form=form, warning=msg)
 
+@bp.route("/list_data", methods=["GET"])
+@auth_required()
+def list_data():
+    """reagents list as DataTables server-side processing json"""
+    query = db.session.query(
+        Inventory.id,
+        Inventory.name,
+        Inventory.size,
+        Inventory.location_id,
+        Locations.name.label("location"),
+        Inventory.amount,
+        Inventory.amount2,
+        Inventory.amount_limit,
+    ).outerjoin(Locations, Inventory.location_id == Locations.id)
+
+    location_id = request.args.get("location_id", type=int)
+    if location_id is not None:
+        query = query.filter(Inventory.location_id == location_id)
+
+    columns = [
+        Inventory.name,
+        Inventory.size,
+        Locations.name,
+        Inventory.amount,
+        Inventory.amount2,
+    ]
+
+    def row(r):
+        return {
+            "id": r.id,
+            "name": r.name,
+            "size": r.size,
+            "location_id": r.location_id,
+            "location": r.location,
+            "amount": r.amount,
+            "amount2": r.amount2,
+            "low": (r.amount or 0) + (r.amount2 or 0) < (r.amount_limit or 0),
+        }
+
+    def records_total():
+        return cached_value(
+            ("inventory",), lambda: query.order_by(None).count(), "list_data", location_id
+        )
+
+    data = cached_data(
+        ("inventory", "inventory_search", "locations"),
+        lambda: server_side_response(
+            query, columns, Inventory.id, request.args, row, search, records_total
+        ),
+        ignore_args=("draw", "_"),
+    )
+    data["draw"] = request.args.get("draw", 0, type=int)
+    return jsonify(data)
 
-@app.route("/show/<int:_id>/")
+
+@bp.route("/show/<int:_id>/")
 @auth_required()
+@cached_page("inventory", "locations", "departments")
 def show(_id):
     """show a specific reagent"""
     reagent = Inventory.query.get_or_404(_id)
     return render_template("show.html", title=reagent.name, reagent=reagent)
 
 
-@app.route("/create", methods=["GET", "POST"])
+@bp.route("/create", methods=["GET", "POST"])
 @auth_required()
 @roles_required("admin")
 def create():
@@ -119,43 +183,45 @@ def create():
             order=order,
         )
 
-        if not current_user.has_role(location.department.short_name):
+        if not permitted(location.department_id):
             flash(
                 f"You have not permission to add a reagent in a location pertaining to {location.department.name}",
                 "danger",
             )
-            return redirect(url_for("create"))
+            return redirect(url_for("reagent.create"))
 
         db.session.add(reagent)
-        db.session.commit()
-        db.session.refresh(reagent)
+        db.session.flush()
+        index_reagent(reagent)
         add_log(
             reagent.id,
             current_user.id,
-            f"created item {reagent.id} - {reagent.name}"
+            f"created item {reagent.id} - {reagent.name}",
+            event_type="created",
         )
-        return redirect(url_for("list"))
+        db.session.commit()
+        return redirect(url_for("reagent.list"))
 
     return render_template("create.html", form=form, title=title)
 
 
-@app.route("/edit/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/edit/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
 @roles_required("admin")
 def edit(_id):
     """edit a specific reagent"""
     reag = db.session.query(Inventory).filter(Inventory.id == _id).first_or_404()
-    loc = [(loc.id, loc.name) for loc in Locations.query.all()]
+    loc = location_choices()
     form = EditForm(csrf_enabled=False, exclude_fk=False, obj=reag)
     form.location.choices = loc
     form.location.data = reag.location.id
 
-    if not current_user.has_role(reag.location.department.short_name):
+    if not permitted(reag.location.department_id):
         flash(
             f"You have not permission to edit a reagent in a location pertaining to {reag.location.department.name}",
             "danger",
         )
-        return redirect(url_for("show", _id=_id))
+        return redirect(url_for("reagent.show", _id=_id))
 
     r1 = reag.__dict__.copy()
 
@@ -179,23 +245,28 @@ def edit(_id):
         k2 = set(r2.keys())
         common_keys = set(k1).intersection(set(k2))
         try:
-            db.session.commit()
+            index_reagent(reag)
             for key in common_keys:
                 if str(r1[key]) != str(r2[key]):
                     add_log(
                         reag.id,
                         current_user.id,
                         f'updated item {reag.id} - {reag.name}: {key} value changed from "{str(r1[key])}" to "{str(r2[key])}"',
+                        event_type="updated",
+                        field_name=key,
+                        old_value=str(r1[key]),
+                        new_value=str(r2[key]),
                     )
+            db.session.commit()
         except Exception as e:
             flash(f"Error updating {str(e)}", "danger")
             db.session.rollback()
-        return redirect(url_for("show", _id=_id))
+        return redirect(url_for("reagent.show", _id=_id))
 
     return render_template("edit.html", _id=_id, form=form, title="Edit reagent")
 
 
-@app.route("/delete/<int:_id>/", methods=["GET"])
+@bp.route("/delete/<int:_id>/", methods=["GET"])
 @auth_required()
 @roles_required("admin")
 def delete(_id):
@@ -203,191 +274,232 @@ def delete(_id):
 
     reagent = db.session.query(Inventory).filter(Inventory.id == _id).first()
     if reagent:
-        if not current_user.has_role(reagent.location.department.short_name):
+        if not permitted(reagent.location.department_id):
             flash(
                 f"You have not permission to delete a reagent in a location pertaining to {reagent.location.department.name}",
                 "danger",
             )
-            return redirect(url_for("show", _id=_id))
+            return redirect(url_for("reagent.show", _id=_id))
 
         try:
-            db.session.delete(reagent)
-            db.session.commit()
             add_log(
-                reagent.id,
+                None,
                 current_user.id,
                 f"deleted item {reagent.id} - {reagent.name}",
+                event_type="deleted",
             )
+            unindex_reagent(reagent.id)
+            forget_consumption(reagent.id)
+            db.session.delete(reagent)
+            db.session.commit()
             flash("Item deleted", "info")
         except Exception as e:
             flash(f"Error deleting {reagent.id} with error {str(e)}", "danger")
             db.session.rollback()
     else:
         flash(f"Error deleting product with id {_id}", "danger")
-        return redirect(url_for("show", _id=_id))
-    return redirect(url_for("list"))
+        return redirect(url_for("reagent.show", _id=_id))
+    return redirect(url_for("reagent.list"))
 
 
-@app.route("/plus/<int:_id>/")
+@bp.route("/plus/<int:_id>/")
 @auth_required()
 @roles_required("admin")
 def plus(_id):
     """add 1 item of a specific reagent in lab"""
-    reagent = Inventory.query.get_or_404(_id)
+    reagent = reagents_query().filter(Inventory.id == _id).first_or_404()
 
-    if not current_user.has_role(reagent.location.department.short_name):
+    if not permitted(reagent.location.department_id):
         flash(
             f"You have not permission to add a reagent in a location pertaining to {reagent.location.department.name}",
             "danger",
         )
-        return redirect(url_for("show", _id=_id))
+        return redirect(url_for("reagent.show", _id=_id))
 
-
-    reagent.amount += 1
-    db.session.commit()
+    update_stock(
+        reagent.id,
+        current_user.id,
+        {Inventory.amount: Inventory.amount + 1},
+        [],
+        f"added itemid {reagent.id} - {reagent.name}",
+        event_type="added",
+        quantity_delta=1,
+    )
     # flash("Added 1 item to laboratory", "info")
-    add_log(reagent.id, current_user.id, f"added itemid {reagent.id} - {reagent.name}")
-    return redirect(url_for("show", _id=_id))
+    return redirect(url_for("reagent.show", _id=_id))
 
 
-@app.route("/minus/<int:_id>/")
+@bp.route("/minus/<int:_id>/")
 @auth_required()
 @roles_required("admin")
 def minus(_id):
     """remove 1 item of a specific reagent in lab"""
-    reagent = Inventory.query.get_or_404(_id)
+    reagent = reagents_query().filter(Inventory.id == _id).first_or_404()
 
-    if not current_user.has_role(reagent.location.department.short_name):
+    if not permitted(reagent.location.department_id):
         flash(
             f"You have not permission to remove a reagent in a location pertaining to {reagent.location.department.name}",
             "danger",
         )
-        return redirect(url_for("show", _id=_id))
+        return redirect(url_for("reagent.show", _id=_id))
 
-    if reagent.amount == 0:
+    if not update_stock(
+        reagent.id,
+        current_user.id,
+        {Inventory.amount: Inventory.amount - 1},
+        [Inventory.amount > 0],
+        f"removed itemid {reagent.id} - {reagent.name}",
+        event_type="removed",
+        quantity_delta=-1,
+    ):
         flash("No more items available in laboratory!", "danger")
-        return redirect(url_for("show", _id=_id))
-    reagent.amount -= 1
-    db.session.commit()
     # flash("Removed 1 item from laboratory", "info")
-    add_log(reagent.id, current_user.id, f"removed itemid {reagent.id} - {reagent.name}")
-
-    return redirect(url_for("show", _id=_id))
+    return redirect(url_for("reagent.show", _id=_id))
 
 
-@app.route("/move/<int:_id>/")
+@bp.route("/move/<int:_id>/")
 @auth_required()
 @roles_required("admin")
 def move(_id):
     """move 1 item of a specific reagent from warehouse to lab"""
-    reagent = Inventory.query.get_or_404(_id)
+    reagent = reagents_query().filter(Inventory.id == _id).first_or_404()
 
-    if not current_user.has_role(reagent.location.department.short_name):
+    if not permitted(reagent.location.department_id):
         flash(
             f"You have not permission to move a reagent in a location pertaining to {reagent.location.department.name}",
             "danger",
         )
-        return redirect(url_for("show", _id=_id))
-
-    if reagent.amount2 == 0:
-        flash("No more items available in the warehouse", "danger")
-        return redirect(url_for("show", _id=_id))
+        return redirect(url_for("reagent.show", _id=_id))
 
-    reagent.amount2 -= 1
-    reagent.amount += 1
-    db.session.commit()
-    # flash("Moved one item from warehouse to laboratory", "info")
-    add_log(
+    if not update_stock(
         reagent.id,
         current_user.id,
+        {
+            Inventory.amount2: Inventory.amount2 - 1,
+            Inventory.amount: Inventory.amount + 1,
+        },
+        [Inventory.amount2 > 0],
         f"moved from warehouse itemid {reagent.id} - {reagent.name}",
-    )
-    return redirect(url_for("show", _id=_id))
+        event_type="moved",
+        quantity_delta=0,
+    ):
+        flash("No more items available in the warehouse", "danger")
+    # flash("Moved one item from warehouse to laboratory", "info")
+    return redirect(url_for("reagent.show", _id=_id))
 
 
-@app.route("/add/<int:_id>/")
+@bp.route("/add/<int:_id>/")
 @auth_required()
 @roles_required("admin")
 def add(_id):
     """add 1 item of a specific reagent to warehouse"""
-    reagent = Inventory.query.get_or_404(_id)
+    reagent = reagents_query().filter(Inventory.id == _id).first_or_404()
 
-    if not current_user.has_role(reagent.location.department.short_name):
+    if not permitted(reagent.location.department_id):
         flash(
             f"You have not permission to add a reagent in a location pertaining to {reagent.location.department.name}",
             "danger",
         )
-        return redirect(url_for("show", _id=_id))
+        return redirect(url_for("reagent.show", _id=_id))
 
-    reagent.amount2 += 1
-    db.session.commit()
-    # flash("Added 1 item to warehouse", "info")
-    add_log(
+    update_stock(
         reagent.id,
         current_user.id,
+        {Inventory.amount2: Inventory.amount2 + 1},
+        [],
         f"added to warehouse itemid {reagent.id} - {reagent.name}",
+        event_type="added_warehouse",
+        quantity_delta=1,
     )
-    return redirect(url_for("show", _id=_id))
+    # flash("Added 1 item to warehouse", "info")
+    return redirect(url_for("reagent.show", _id=_id))
 
 
-@app.route("/show_log/<int:_id>/")
+@bp.route("/show_log/<int:_id>/")
 @auth_required()
 @roles_required("admin")
+@cached_page("applog", "inventory", "locations", "user")
 def show_log(_id):
-    """list logs"""
+    """list logs, one page at a time (all reagents for id 0)"""
+    filters = log_filters(Applog, request.args, _id or None)
+    logs, cursor = log_page(
+        Applog,
+        filters,
+        request.args.get("after"),
+        request.args.get("length", LOG_PAGE_SIZE, type=int),
+        applog_options(),
+    )
+    if not logs and not request.args.get("after"):
+        flash("No Logs Found for this reagent !", "info")
+    return render_template(
+        "show_log.html",
+        logs=logs,
+        filters={k: str(v) for k, v in filters.items() if k != "subject"},
+        event_types=EVENT_TYPES,
+        cursor=cursor,
+        title="Logs report",
+    )
 
-    if request.method == "GET":
-        if _id == 0:
-            logs = Applog.query.all()
-        else:
-            logs = Applog.query.filter(Applog.product_id == _id).all()
 
-    if len(logs) > 0:
-        flash(f"Log rows: {str(len(logs))}", "info")
-        return render_template("show_log.html", logs=logs, title="Logs report")
-    flash("No Logs Found for this reagent !", "info")
-    return render_template("show_log.html", title="Logs report")
+@bp.route("/log_data", methods=["GET"])
+@auth_required()
+@roles_required("admin")
+def log_data():
+    """one page of logs as json, see app.logs.log_filters for the arguments;
+    the next page is requested with after=<next>"""
+    filters = log_filters(Applog, request.args)
+    logs, cursor = log_page(
+        Applog,
+        filters,
+        request.args.get("after"),
+        request.args.get("length", LOG_PAGE_SIZE, type=int),
+        applog_options(),
+    )
+    return jsonify({"data": [applog_row(log) for log in logs], "next": cursor})
 
 
-@app.route("/order/<int:_id>/", methods=["GET"])
+@bp.route("/order/<int:_id>/", methods=["GET"])
 @auth_required()
 def order(_id):
     """set order for a reagent"""
-    reagent = db.session.query(Inventory).filter(Inventory.id == _id).first()
+    reagent = reagents_query().filter(Inventory.id == _id).first()
     if reagent:
-        if not current_user.has_role(reagent.location.department.short_name):
+        if not permitted(reagent.location.department_id):
             flash(
                 f"You have not permission to order a reagent in a location pertaining to {reagent.location.department.name}",
                 "danger",
             )
-            return redirect(url_for("show", _id=_id))
+            return redirect(url_for("reagent.show", _id=_id))
 
-        reagent.order += 1
+        name = reagent.name
         try:
-            db.session.commit()
-            flash(f"Set order for 1 unit of item {reagent.name}", "info")
-            add_log(
+            if update_stock(
                 reagent.id,
                 current_user.id,
-                f"Set order for item {reagent.id} - {reagent.name}",
-            )
+                {Inventory.order: Inventory.order + 1},
+                [],
+                f"Set order for item {reagent.id} - {name}",
+                event_type="ordered",
+            ):
+                flash(f"Set order for 1 unit of item {name}", "info")
         except Exception as e:
-            flash(f"Error ordering {reagent.id} with error {str(e)}", "danger")
+            flash(f"Error ordering {_id} with error {str(e)}", "danger")
             db.session.rollback()
     else:
         flash(f"Error ordering product with id {str(_id)}", "danger")
-        return redirect(url_for("show", _id=_id))
-    return redirect(url_for("show", _id=_id, title=reagent.name))
+        return redirect(url_for("reagent.show", _id=_id))
+    return redirect(url_for("reagent.show", _id=_id, title=name))
 
 
-@app.route("/view_orders/", methods=["GET"])
+@bp.route("/view_orders/", methods=["GET"])
 @auth_required()
 @roles_required("admin")
+@cached_page("inventory", "locations", "departments")
 def view_orders():
     """view orders"""
 
-    orders = db.session.query(Inventory).filter(Inventory.order > 0)
-    if orders.count() > 0:
+    orders = permitted_reagents(reagents_query().filter(Inventory.order > 0)).all()
+    if len(orders) > 0:
         return render_template(
             "view_orders.html", reagents=orders, title="Reagents to be purchased"
         )
@@ -397,145 +509,175 @@ def view_orders():
     )
 
 
-@app.route("/reset_order/<int:_id>/", methods=["GET"])
+@bp.route("/reset_order/<int:_id>/", methods=["GET"])
 @auth_required()
 @roles_required("admin")
 def reset_order(_id):
     """reset order for a specific reagent"""
 
-    reagent = db.session.query(Inventory).filter(Inventory.id == _id).first()
+    reagent = reagents_query().filter(Inventory.id == _id).first()
     if reagent:
-        if not current_user.has_role(reagent.location.department.short_name):
+        if not permitted(reagent.location.department_id):
             flash(
                 f"You have not permission to reset order for a reagent in a location pertaining to {reagent.location.department.name}",
                 "danger",
             )
-            return redirect(url_for("show", _id=_id))
+            return redirect(url_for("reagent.show", _id=_id))
 
-        reagent.order = 0
         try:
-            db.session.commit()
-            flash("Item orders reset", "info")
-            add_log(
+            if update_stock(
                 reagent.id,
                 current_user.id,
+                {Inventory.order: 0},
+                [],
                 f"reset orders for item {reagent.id} - {reagent.name}",
-            )
+                event_type="order_reset",
+            ):
+                flash("Item orders reset", "info")
         except Exception as e:
-            flash(f"Error reset ordering {reagent.id} with error {str(e)}", "danger")
+            flash(f"Error reset ordering {_id} with error {str(e)}", "danger")
             db.session.rollback()
     else:
         flash(f"Error resetting order product with id: {str(_id)}", "danger")
-        return redirect(url_for("show", _id=_id))
-    return redirect(url_for("view_orders"))
+        return redirect(url_for("reagent.show", _id=_id))
+    return redirect(url_for("reagent.view_orders"))
 
 
-@app.route("/view_low_quantity/", methods=["GET"])
+@bp.route("/view_low_quantity/", methods=["GET"])
 @auth_required()
 @roles_required("admin")
+@cached_page("inventory", "locations", "departments")
 def view_low_quantity():
     """view list of reagent with low quantity"""
 
-    reag = db.session.query(Inventory).filter(
-        (Inventory.amount + Inventory.amount2) < Inventory.amount_limit
-    )
-    if reag.count() > 0:
+    reag = permitted_reagents(
+        reagents_query().filter(
+            (Inventory.amount + Inventory.amount2) < Inventory.amount_limit
+        )
+    ).all()
+    if len(reag) > 0:
         return render_template("list_low.html", reagents=reag, title="Low Quantity Report")
     flash("No reagents below minimum stock limits", "info")
     return render_template("list_low.html", reagents=reag, title="Low quantity Report")
 
 
-@app.route("/view_zero_quantity/", methods=["GET"])
+@bp.route("/view_zero_quantity/", methods=["GET"])
 @auth_required()
 @roles_required("admin")
+@cached_page("inventory", "locations", "departments")
 def view_zero_quantity():
     """view list of reagent with zero quantity"""
 
-    reag = db.session.query(Inventory).filter(
-        (Inventory.amount + Inventory.amount2) == 0
-    )
-    if reag.count() > 0:
+    reag = permitted_reagents(
+        reagents_query().filter(
+            (Inventory.amount + Inventory.amount2) == 0
+        )
+    ).all()
+    if len(reag) > 0:
         return render_template("list_zero.html", reagents=reag, title="Zero Quantity Report")
     flash("No reagents with zero amount", "info")
     return render_template("list_zero.html", reagents=reag, title="Zero Quantity Report")
 
 
-@app.route("/export", methods=["GET"])
+@bp.route("/export", methods=["GET"])
 @auth_required()
 @roles_required("superadmin")
 def export():
     """export reagents table as csv"""
-    reagents = Inventory.query.all()
-    with open((os.path.join(app.config['APP_ROOT'], 'inventory.csv')), "w", newline="", encoding="utf-8") as csvfile:
-        csvwriter = csv.writer(csvfile, delimiter=",")
-        csvwriter.writerow(
-            [
-                "Id",
-                "Name",
-                "Location",
-                "amount lab",
-                "amount deposit",
-                "amount limit",
-                "cas_number",
-                "product code",
-                "supplier",
-                "batch",
-                "expiry date",
-                "size",
-                "notes",
-                "to be purchased",
-            ]
+    rows = stream_query(
+        select(
+            Inventory.id,
+            Inventory.name,
+            Inventory.location_id,
+            Inventory.amount,
+            Inventory.amount2,
+            Inventory.amount_limit,
+            Inventory.cas_number,
+            Inventory.product_code,
+            Inventory.supplier,
+            Inventory.batch,
+            Inventory.expiry_date,
+            Inventory.size,
+            Inventory.notes,
+            Inventory.order,
+        ).order_by(Inventory.id)
+    )
+    return csv_response(
+        "inventory.csv",
+        [
+            "Id",
+            "Name",
+            "Location",
+            "amount lab",
+            "amount deposit",
+            "amount limit",
+            "cas_number",
+            "product code",
+            "supplier",
+            "batch",
+            "expiry date",
+            "size",
+            "notes",
+            "to be purchased",
+        ],
+        rows,
+        request.args.get("compression"),
+    )
+
+
+@bp.route("/export_log", methods=["GET"])
+@auth_required()
+@roles_required("superadmin")
+def export_log():
+    """export log table as csv"""
+    rows = stream_query(
+        select(
+            Applog.id,
+            Applog.event_time,
+            Applog.product_id,
+            Inventory.name,
+            User.username,
+            Applog.event_type,
+            Applog.quantity_delta,
+            Applog.field_name,
+            Applog.old_value,
+            Applog.new_value,
+            Applog.event_detail,
         )
-        for r in reagents:
-            csvwriter.writerow(
-                [
-                    r.id,
-                    r.name,
-                    r.location_id,
-                    r.amount,
-                    r.amount2,
-                    r.amount_limit,
-                    r.cas_number,
-                    r.product_code,
-                    r.supplier,
-                    r.batch,
-                    r.expiry_date,
-                    r.size,
-                    r.notes,
-                    r.order,
-                ]
-            )
-    try:
-        return send_file("inventory.csv", mimetype="text/csv", as_attachment=True)
-    except Exception as e:
-        return str(e)
+        .outerjoin(Inventory, Applog.product_id == Inventory.id)
+        .outerjoin(User, Applog.user_id == User.id)
+        .order_by(Applog.id)
+    )
+    return csv_response(
+        "log.csv",
+        [
+            "Id",
+            "Date",
+            "product id",
+            "product name",
+            "user",
+            "event type",
+            "quantity delta",
+            "field",
+            "old value",
+            "new value",
+            "detail",
+        ],
+        rows,
+        request.args.get("compression"),
+    )
 
 
-@app.route("/stats", methods=["GET"])
+@bp.route("/stats", methods=["GET"])
 @auth_required()
 @roles_required("admin")
+@cached_page("consumption_daily", "inventory", "locations", "departments")
 def stats():
 
     days = int(request.args.get('days', 365))
 
-    logs = Applog.query.filter(Applog.event_time > (datetime.now() - timedelta(days=days)), Applog.event_time <= datetime.now()).all()
-    reag = Inventory.query.all()
-    idslist = set()
-    for l in logs:
-        if l.product_id == None:
-            continue
-        idslist.add(l.product_id)
-    res = {el:0 for el in idslist}
-    for i in idslist:
-        c = 0
-        for l in logs:
-            if l.product_id == i:
-                if l.event_detail.startswith("updated"):
-                    c += 1
-        res[i] = c
+    res = consumption_report(days, permitted_department_ids())
 
     title = f"Items consumed in the last { days } days"
 
-    return render_template("stats.html", stats=res, reag=reag, title=title)
-
-
+    return render_template("stats.html", stats=res, title=title)
@@ -0,0 +1,129 @@
+import re
+import unicodedata
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, false, insert, select
+
+from app import db
+from app.models import Inventory, InventorySearchToken
+
+# fields of a reagent that can be searched
+SEARCH_FIELDS = ("name", "cas_number", "product_code", "supplier", "batch")
+
+TOKEN_LENGTH = 64
+# letters and digits of any script are kept, underscores split words
+_split = re.compile(r"[\W_]+")
+
+
+def fold(value):
+    """casefolded text without accents, "Acétone" and "acetone" match"""
+    value = unicodedata.normalize("NFKD", str(value).strip().casefold())
+    return "".join(c for c in value if not unicodedata.combining(c))
+
+
+def tokenize(value):
+    """folded words of a text, plus the whole text itself so that
+    values like a CAS number (64-17-5) can be searched as typed"""
+    if not value:
+        return set()
+    value = fold(value)
+    tokens = {t[:TOKEN_LENGTH] for t in _split.split(value) if t}
+    if value:
+        tokens.add(value[:TOKEN_LENGTH])
+    return tokens
+
+
+def reagent_tokens(reagent):
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens |= tokenize(getattr(reagent, field))
+    return tokens
+
+
+def index_reagent(reagent):
+    """(re)build the search tokens of a reagent, the caller commits"""
+    db.session.execute(
+        delete(InventorySearchToken).where(InventorySearchToken.inventory_id == reagent.id)
+    )
+    tokens = reagent_tokens(reagent)
+    if tokens:
+        db.session.execute(
+            insert(InventorySearchToken),
+            [{"token": t, "inventory_id": reagent.id} for t in tokens],
+        )
+
+
+def unindex_reagent(_id):
+    """remove the search tokens of a reagent, the caller commits"""
+    db.session.execute(
+        delete(InventorySearchToken).where(InventorySearchToken.inventory_id == _id)
+    )
+
+
+def search_filter(text):
+    """return a condition on Inventory.id matching every word of text
+
+    Each word is looked up as a prefix of the indexed tokens, which is a
+    range scan on the token primary key: the cost depends on the number of
+    matches, not on the size of the inventory.
+    Returns None for an empty text, and a condition matching nothing when
+    the text has no searchable word (only punctuation).
+    """
+    if not text.strip():
+        return None
+    words = {t for t in _split.split(fold(text)) if t}
+    if not words:
+        return false()
+    conditions = []
+    for word in words:
+        word = word[:TOKEN_LENGTH]
+        ids = select(InventorySearchToken.inventory_id).where(
+            InventorySearchToken.token.like(word + "%")
+        )
+        conditions.append(Inventory.id.in_(ids))
+    return db.and_(*conditions)
+
+
+def search(query, text):
+    """restrict a query on Inventory to the reagents matching text"""
+    condition = search_filter(text)
+    if condition is None:
+        return query
+    return query.filter(condition)
+
+
+def rebuild_index(batch_size=1000):
+    """rebuild the whole search index, returns the number of reagents indexed"""
+    db.session.execute(delete(InventorySearchToken))
+    count = 0
+    last_id = 0
+    columns = [Inventory.id] + [getattr(Inventory, f) for f in SEARCH_FIELDS]
+    while True:
+        rows = db.session.execute(
+            select(*columns)
+            .where(Inventory.id > last_id)
+            .order_by(Inventory.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        values = [
+            {"token": t, "inventory_id": row.id}
+            for row in rows
+            for t in reagent_tokens(row)
+        ]
+        if values:
+            db.session.execute(insert(InventorySearchToken), values)
+        count += len(rows)
+        last_id = rows[-1].id
+    db.session.commit()
+    return count
+
+
+@click.command("reindex-search")
+@with_appcontext
+def reindex_search_command():
+    """Rebuild the reagents search index."""
+    count = rebuild_index()
+    click.echo(f"indexed {count} reagents")
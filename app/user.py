@@ -1,4 +1,6 @@
 from flask import (
+    Blueprint,
+    current_app,
     render_template,
     make_response,
     flash,
@@ -7,9 +9,7 @@ from flask import (
     request,
     session,
 )
-from app import app
 from app import db
-from app import log
 from app.forms import (
     EditProfileForm,
     EditRolesForm,
@@ -36,67 +36,10 @@ from flask_security import (
     UserMixin,
 )
 
-user_datastore = SQLAlchemyUserDatastore(db, User, Role)
-app.security = Security(app, user_datastore)
-
-# one time setup
-with app.app_context():
-    # Create users to test with
-    db.create_all()
-    if not app.security.datastore.find_role("admin"):
-        app.security.datastore.create_role(name="admin",
-                                           description="admin role",
-                                           permissions="admin"
-        )
-
-    if not app.security.datastore.find_role("superadmin"):
-        app.security.datastore.create_role(name="superadmin",
-                                           description="superadmin role",
-                                           permissions="superadmin"
-        )
-
-    if not app.security.datastore.find_role("QC"):
-        app.security.datastore.create_role(name="QC",
-                                           description="QC dept",
-                                           permissions="QC"
-        )
-
-    if not app.security.datastore.find_role("VL"):
-        app.security.datastore.create_role(name="VL",
-                                           description="VL dept",
-                                           permissions="VL"
-        )
-
-    if app.config["CREATE_USERS"]:
-        if not app.security.datastore.find_user(email="user@test.com"):
-            app.security.datastore.create_user(
-                email="user@test.com",
-                password=hash_password("password"),
-                username="User1",
-                active=True,
-            )
-
-        if not app.security.datastore.find_user(email="admin@test.com"):
-            app.security.datastore.create_user(
-                email="admin@test.com",
-                password=hash_password("password"),
-                username="Admin1",
-                roles=["admin"],
-                active=True,
-            )
-
-        if not app.security.datastore.find_user(email="admin2@test.com"):
-            app.security.datastore.create_user(
-                email="admin2@test.com",
-                password=hash_password("password"),
-                username="Admin2",
-                roles=["admin", "superadmin"],
-                active=True,
-            )
-    db.session.commit()
+bp = Blueprint("user", __name__)
 
 
-@app.route("/edit_profile", methods=["GET", "POST"])
+@bp.route("/edit_profile", methods=["GET", "POST"])
 @auth_required()
 def edit_profile():
     """edit profile form"""
@@ -107,16 +50,16 @@ def edit_profile():
             current_user.username = form.username.data
             db.session.commit()
             flash("Your changes have been saved.", "info")
-            app.logger.info(
+            current_app.logger.info(
                 f"user {current_user.id} updated, new email: {current_user.email}, new userame: {current_user.username}"
             )
-            return redirect(url_for("edit_profile"))
+            return redirect(url_for("user.edit_profile"))
     except IntegrityError:
         flash(
             "The email or username you choose is already registered, user not updated",
             "danger",
         )
-        return redirect(url_for("edit_profile"))
+        return redirect(url_for("user.edit_profile"))
     if request.method == "GET":
         form.email.data = current_user.email
         form.username.data = current_user.username
@@ -126,7 +69,7 @@ def edit_profile():
     )
 
 
-@app.route("/change_pw/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/change_pw/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
 def change_pw(_id):
     """change password form"""
@@ -140,18 +83,18 @@ def change_pw(_id):
         if form.validate_on_submit():
             user.password = hash_password(form.password.data)
             flash(f"Password changed for {user.email}", "info")
-            app.logger.info(f"user {user.email} password changed by user {current_user.id}")
+            current_app.logger.info(f"user {user.email} password changed by user {current_user.id}")
             db.session.commit()
-            return redirect(url_for("users"))
+            return redirect(url_for("user.users"))
         return render_template(
             "change_pw.html", title="Change password", form=form, user=user
         )
     else:
         flash(f"You cannot change the password for user {_id}", "danger")
-        return redirect(url_for("users"))
+        return redirect(url_for("user.users"))
 
 
-@app.route("/users", methods=["GET"])
+@bp.route("/users", methods=["GET"])
 @auth_required()
 @roles_required("superadmin")
 def users():
@@ -160,7 +103,7 @@ def users():
     return render_template("users.html", users=_users, title="Users")
 
 
-@app.route("/edit_role/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/edit_role/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
 @roles_required("superadmin")
 def edit_role(_id):
@@ -173,31 +116,31 @@ def edit_role(_id):
     vl_role = user_datastore.find_role("VL")
     if not user:
         flash(f"Not existing user id {_id}", "danger")
-        return redirect(url_for("users"))
+        return redirect(url_for("user.users"))
     try:
         if form.validate_on_submit():
             if form.admin.data:
-                app.security.datastore.add_role_to_user(user, admin_role)
+                current_app.security.datastore.add_role_to_user(user, admin_role)
             else:
-                app.security.datastore.remove_role_from_user(user, admin_role)
+                current_app.security.datastore.remove_role_from_user(user, admin_role)
             if form.superadmin.data:
-                app.security.datastore.add_role_to_user(user, superadmin_role)
+                current_app.security.datastore.add_role_to_user(user, superadmin_role)
             else:
-                app.security.datastore.remove_role_from_user(user, superadmin_role)
+                current_app.security.datastore.remove_role_from_user(user, superadmin_role)
             if form.qc.data:
-                app.security.datastore.add_role_to_user(user, qc_role)
+                current_app.security.datastore.add_role_to_user(user, qc_role)
             else:
-                app.security.datastore.remove_role_from_user(user, qc_role)
+                current_app.security.datastore.remove_role_from_user(user, qc_role)
             if form.vl.data:
-                app.security.datastore.add_role_to_user(user, vl_role)
+                current_app.security.datastore.add_role_to_user(user, vl_role)
             else:
-                app.security.datastore.remove_role_from_user(user, vl_role)
+                current_app.security.datastore.remove_role_from_user(user, vl_role)
             db.session.commit()
             flash("Your changes have been saved.", "info")
-            app.logger.info(
+            current_app.logger.info(
                 f"user {current_user.id} updated by user {current_user.id}, admin role: {form.admin.data}, superadmin role: {form.superadmin.data}, qc role: {form.qc.data}, vl role: {form.vl.data}"
             )
-            return redirect(url_for("users"))
+            return redirect(url_for("user.users"))
         if request.method == "GET":
             if user.has_role("admin"):
                 form.admin.data = True
@@ -220,7 +163,7 @@ def edit_role(_id):
     )
 
 
-@app.route("/edit_user/<int:_id>/", methods=["GET", "POST"])
+@bp.route("/edit_user/<int:_id>/", methods=["GET", "POST"])
 @auth_required()
 @roles_required("superadmin")
 def edit_user(_id):
@@ -230,7 +173,7 @@ def edit_user(_id):
         user = User.query.filter_by(id=_id).first()
         if not user:
             flash(f"Not existing user with id {_id}", "danger")
-            return redirect(url_for("users"))
+            return redirect(url_for("user.users"))
         try:
             if form.validate_on_submit():
                 user.email = form.email.data
@@ -238,13 +181,13 @@ def edit_user(_id):
                 user.active = form.active.data
                 db.session.commit()
                 flash("Your changes have been saved.", "info")
-                app.logger.info(
+                current_app.logger.info(
                     f"user {user.id} updated by user {current_user.id}, email: {user.email}, username: {user.username}, active: {user.active}"
                 )
-                return redirect(url_for("users"))
+                return redirect(url_for("user.users"))
         except IntegrityError:
             flash("Email or username already registered, user not updated", "danger")
-            return redirect(url_for("users"))
+            return redirect(url_for("user.users"))
         if request.method == "GET":
             form.email.data = user.email
             form.username.data = user.username
@@ -253,10 +196,10 @@ def edit_user(_id):
             "edit_user.html", title="Edit User", form=form, user=user
         )
     flash(f"You cannot change data for user {_id}", "danger")
-    return redirect(url_for("users"))
+    return redirect(url_for("user.users"))
 
 
-@app.route("/create_user", methods=["GET", "POST"])
+@bp.route("/create_user", methods=["GET", "POST"])
 @auth_required()
 @roles_required("superadmin")
 def create_user():
@@ -290,7 +233,7 @@ def create_user():
                     return render_template(
                         "create_user.html", title="Add a new user", form=form
                     )
-                app.security.datastore.create_user(
+                current_app.security.datastore.create_user(
                     email=email,
                     password=password,
                     username=username,
@@ -298,17 +241,17 @@ def create_user():
                 )
                 user = User.query.filter_by(username=username).first()
                 if admin:
-                    app.security.datastore.add_role_to_user(user, admin_role)
+                    current_app.security.datastore.add_role_to_user(user, admin_role)
                 if superadmin:
-                    app.security.datastore.add_role_to_user(user, superadmin_role)
+                    current_app.security.datastore.add_role_to_user(user, superadmin_role)
                 if qc:
-                    app.security.datastore.add_role_to_user(user, qc_role)
+                    current_app.security.datastore.add_role_to_user(user, qc_role)
                 if vl:
-                    app.security.datastore.add_role_to_user(user, vl_role)
+                    current_app.security.datastore.add_role_to_user(user, vl_role)
 
                 db.session.commit()
-                app.logger.info(f"created user {email} by user {current_user.id}")
-                return redirect(url_for("users"))
+                current_app.logger.info(f"created user {email} by user {current_user.id}")
+                return redirect(url_for("user.users"))
         except Exception as e:
             flash(f"Error creating {user.id} with error {str(e)}", "danger")
             db.session.rollback()
@@ -318,7 +261,7 @@ def create_user():
     return render_template("create_user.html", title="Add a new user", form=form)
 
 
-@app.route("/delete_user/<int:_id>/", methods=["GET"])
+@bp.route("/delete_user/<int:_id>/", methods=["GET"])
 @auth_required()
 @roles_required("superadmin")
 def delete_user(_id):
@@ -329,11 +272,11 @@ def delete_user(_id):
             db.session.delete(user)
             db.session.commit()
             flash("User deleted", "info")
-            app.logger.info(f"deleted user id {user.id} (email: {user.email}) by user {current_user.id} (email: {current_user.email})")
+            current_app.logger.info(f"deleted user id {user.id} (email: {user.email}) by user {current_user.id} (email: {current_user.email})")
         except Exception as e:
             flash(f"Error deleting user id {str(user.id)} with error {str(e)}", "danger")
             db.session.rollback()
     else:
         flash(f"Error deleting user with id: {str(user.id)}", "danger")
-        return redirect(url_for("users"))
-    return redirect(url_for("users"))
+        return redirect(url_for("user.users"))
+    return redirect(url_for("user.users"))
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+
+from flask import g, has_request_context
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.dml import Delete, UpdateBase
+
+from app import db
+from app.models import DataVersion
+
+# A version number per table, incremented in the same transaction as any
+# write to it, so caches in every worker process can tell whether the
+# data they hold is still current by comparing versions.
+#
+# Every INSERT, UPDATE and DELETE run on a connection, from the ORM flush
+# as well as bulk statements, records its table on the connection; the
+# versions of the recorded tables are incremented, in name order, right
+# before the session commits.
+#
+# The trade-off: the version row of a table is locked from the increment
+# to the commit, so transactions writing the same table commit one at a
+# time. The increment is the last statement before COMMIT (after the log
+# rows of app.audit), which keeps the lock short, and the name order rules
+# out deadlocks between transactions writing several tables. Incrementing
+# after the commit instead, in a transaction of its own, would not hold the
+# lock, but until then the caches would keep serving the old data, even to
+# the user who just saved the change, and a worker dying in between would
+# leave them stale until the next write to the table.
+
+CHANGED = "changed_tables"
+# the DELETE statements on a table also increment the version "<table>.deleted"
+DELETED = ".deleted"
+
+
+def _load():
+    """({table name: version}, {table name: changed at}), read once per request"""
+    if has_request_context() and "data_versions" in g:
+        return g.data_versions
+    rows = db.session.execute(
+        select(DataVersion.name, DataVersion.version, DataVersion.changed_at)
+    ).all()
+    loaded = (
+        {name: version for name, version, _ in rows},
+        {name: changed_at for name, _, changed_at in rows if changed_at is not None},
+    )
+    if has_request_context():
+        g.data_versions = loaded
+    return loaded
+
+
+def data_versions():
+    """{table name: version}, read once per request"""
+    return _load()[0]
+
+
+def data_version(table):
+    return data_versions().get(table, 0)
+
+
+def deletions(table):
+    """version of the deletes from table, by which caches keyed by row id
+    tell a deleted row from a new one reusing its id"""
+    return data_version(table + DELETED)
+
+
+def data_changed_at(tables):
+    """UTC time of the last write to any of tables, None if unknown"""
+    changed = _load()[1]
+    return max((changed[t] for t in tables if t in changed), default=None)
+
+
+def bump_versions(connection, tables):
+    """increment the version of tables, on the connection of the caller's
+    transaction"""
+    # naive UTC, as DateTime columns do not keep the zone everywhere
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for table in sorted(tables):
+        bump = (
+            update(DataVersion)
+            .where(DataVersion.name == table)
+            .values(version=DataVersion.version + 1, changed_at=now)
+        )
+        if connection.execute(bump).rowcount:
+            continue
+        try:
+            # another worker may create the row at the same time
+            with connection.begin_nested():
+                connection.execute(
+                    insert(DataVersion).values(name=table, version=1, changed_at=now)
+                )
+        except IntegrityError:
+            connection.execute(bump)
+    if has_request_context():
+        g.pop("data_versions", None)
+
+
+@event.listens_for(Engine, "after_execute")
+def _record_write(connection, statement, multiparams, params, execution_options, result):
+    if isinstance(statement, UpdateBase):
+        table = statement.table.name
+        if table != DataVersion.__tablename__:
+            changed = connection.info.setdefault(CHANGED, set())
+            changed.add(table)
+            if isinstance(statement, Delete):
+                changed.add(table + DELETED)
+
+
+@event.listens_for(Engine, "commit")
+@event.listens_for(Engine, "rollback")
+def _forget_writes(connection):
+    connection.info.pop(CHANGED, None)
+
+
+@event.listens_for(db.session, "before_commit")
+def _bump_changed_tables(session):
+    if not session.in_transaction():
+        return
+    # flush first, the ORM writes are recorded when they are executed
+    session.flush()
+    connection = session.connection()
+    tables = connection.info.pop(CHANGED, None)
+    if tables:
+        bump_versions(connection, tables)
@@ -0,0 +1,136 @@
+"""structured event columns on applog
+
+Revision ID: 3f9a2c7d1e05
+Revises:
+Create Date: 2026-10-18 10:12:41.118532
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2c7d1e05'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+COLUMNS = [
+    sa.Column('event_type', sa.String(length=32), nullable=True),
+    sa.Column('quantity_delta', sa.Integer(), nullable=True),
+    sa.Column('field_name', sa.String(length=64), nullable=True),
+    sa.Column('old_value', sa.String(length=512), nullable=True),
+    sa.Column('new_value', sa.String(length=512), nullable=True),
+]
+
+INDEXES = {
+    'ix_applog_product_id_event_time': ['product_id', 'event_time'],
+    'ix_applog_event_type_event_time': ['event_type', 'event_time'],
+}
+
+# legacy event_detail prefixes, the longest first
+PREFIXES = [
+    ('added to warehouse itemid ', 'added_warehouse', 1),
+    ('moved from warehouse itemid ', 'moved', 0),
+    ('added itemid ', 'added', 1),
+    ('removed itemid ', 'removed', -1),
+    ('created item ', 'created', None),
+    ('deleted item ', 'deleted', None),
+    ('Set order for item ', 'ordered', None),
+    ('reset orders for item ', 'order_reset', None),
+    ('deleted location ', 'location_deleted', None),
+    ('deleted department ', 'department_deleted', None),
+]
+
+UPDATED = re.compile(
+    r'^updated item \d+ - .*?: (\w+) value changed from "(.*)" to "(.*)"$', re.S
+)
+
+
+def parse_event_detail(detail):
+    """return event_type, quantity_delta, field_name, old_value, new_value"""
+    detail = detail or ''
+    if detail.startswith('updated'):
+        match = UPDATED.match(detail)
+        if match:
+            field, old, new = match.groups()
+            return 'updated', None, field[:64], old[:512], new[:512]
+        return 'updated', None, None, None, None
+    for prefix, event_type, delta in PREFIXES:
+        if detail.startswith(prefix):
+            return event_type, delta, None, None, None
+    return 'other', None, None, None, None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # tables created by db.create_all() after this revision already have them
+    existing = {c['name'] for c in inspector.get_columns('applog')}
+    with op.batch_alter_table('applog', schema=None) as batch_op:
+        for column in COLUMNS:
+            if column.name not in existing:
+                batch_op.add_column(column.copy())
+
+    indexes = {i['name'] for i in inspector.get_indexes('applog')}
+    for name, columns in INDEXES.items():
+        if name not in indexes:
+            op.create_index(name, 'applog', columns, unique=False)
+
+    # backfill the legacy rows in batches of increasing id
+    applog = sa.table(
+        'applog',
+        sa.column('id', sa.Integer),
+        sa.column('event_detail', sa.String),
+        sa.column('event_type', sa.String),
+        sa.column('quantity_delta', sa.Integer),
+        sa.column('field_name', sa.String),
+        sa.column('old_value', sa.String),
+        sa.column('new_value', sa.String),
+    )
+    update = (
+        applog.update()
+        .where(applog.c.id == sa.bindparam('_id'))
+        .values(
+            event_type=sa.bindparam('event_type'),
+            quantity_delta=sa.bindparam('quantity_delta'),
+            field_name=sa.bindparam('field_name'),
+            old_value=sa.bindparam('old_value'),
+            new_value=sa.bindparam('new_value'),
+        )
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(applog.c.id, applog.c.event_detail)
+            .where(applog.c.id > last_id, applog.c.event_type.is_(None))
+            .order_by(applog.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        values = []
+        for row in rows:
+            event_type, delta, field, old, new = parse_event_detail(row.event_detail)
+            values.append({
+                '_id': row.id,
+                'event_type': event_type,
+                'quantity_delta': delta,
+                'field_name': field,
+                'old_value': old,
+                'new_value': new,
+            })
+        bind.execute(update, values)
+        last_id = rows[-1].id
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='applog')
+    with op.batch_alter_table('applog', schema=None) as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column.name)
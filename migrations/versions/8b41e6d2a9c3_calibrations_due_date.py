@@ -0,0 +1,87 @@
+"""stored due date on calibrations
+
+Revision ID: 8b41e6d2a9c3
+Revises: 3f9a2c7d1e05
+Create Date: 2026-10-18 15:40:07.502914
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+from dateutil.relativedelta import relativedelta
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41e6d2a9c3'
+down_revision = '3f9a2c7d1e05'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+INDEX = 'ix_calibrations_due_date'
+
+
+def due_date(next_date, tolerance, tolerance_units):
+    """next date plus tolerance, as app.functions.calibration_due_date"""
+    if next_date is None:
+        return None
+    if isinstance(next_date, str):
+        next_date = date.fromisoformat(next_date[:10])
+    if tolerance_units not in ('days', 'weeks', 'months', 'years'):
+        return None
+    return next_date + relativedelta(**{tolerance_units: int(tolerance or 0)})
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # tables created by db.create_all() after this revision already have it
+    if 'due_date' not in {c['name'] for c in inspector.get_columns('calibrations')}:
+        with op.batch_alter_table('calibrations', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('due_date', sa.Date(), nullable=True))
+    if INDEX not in {i['name'] for i in inspector.get_indexes('calibrations')}:
+        op.create_index(INDEX, 'calibrations', ['due_date'], unique=False)
+
+    calibrations = sa.table(
+        'calibrations',
+        sa.column('id', sa.Integer),
+        sa.column('next_calibration_date', sa.Date),
+        sa.column('tolerance', sa.Integer),
+        sa.column('tolerance_units', sa.String),
+        sa.column('due_date', sa.Date),
+    )
+    update = (
+        calibrations.update()
+        .where(calibrations.c.id == sa.bindparam('_id'))
+        .values(due_date=sa.bindparam('due_date'))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(
+                calibrations.c.id,
+                calibrations.c.next_calibration_date,
+                calibrations.c.tolerance,
+                calibrations.c.tolerance_units,
+            )
+            .where(calibrations.c.id > last_id)
+            .order_by(calibrations.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(update, [
+            {
+                '_id': row.id,
+                'due_date': due_date(row.next_calibration_date, row.tolerance, row.tolerance_units),
+            }
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name='calibrations')
+    with op.batch_alter_table('calibrations', schema=None) as batch_op:
+        batch_op.drop_column('due_date')
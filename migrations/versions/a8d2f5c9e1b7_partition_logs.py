@@ -0,0 +1,90 @@
+"""monthly partitions of applog and calibrationlog (MySQL)
+
+Revision ID: a8d2f5c9e1b7
+Revises: f6c0d4b2e8a5
+Create Date: 2026-10-18 23:05:52.770416
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+from dateutil.relativedelta import relativedelta
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d2f5c9e1b7'
+down_revision = 'f6c0d4b2e8a5'
+branch_labels = None
+depends_on = None
+
+TABLES = ('applog', 'calibrationlog')
+# months created ahead of the current one, later by 'flask log-partitions'
+MONTHS_AHEAD = 3
+# rows logged before event_time was set everywhere, the partitioning
+# column must be part of the primary key and cannot be NULL
+NO_TIME = '1970-01-01 00:00:00'
+
+
+def enabled(bind):
+    # only for the deployments asking for it, see app/partitions.py
+    return bind.dialect.name in ('mysql', 'mariadb') and current_app.config.get('LOG_PARTITIONING')
+
+
+def partitioned(bind, table):
+    return bind.execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+        "AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+    ), {'table': table}).scalar()
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not enabled(bind):
+        return
+    inspector = sa.inspect(bind)
+    for table in TABLES:
+        if partitioned(bind, table):
+            continue
+        op.execute(f"UPDATE {table} SET event_time = '{NO_TIME}' WHERE event_time IS NULL")
+        # partitioned InnoDB tables cannot have foreign keys
+        for fk in inspector.get_foreign_keys(table):
+            op.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {fk['name']}")
+        op.execute(
+            f"ALTER TABLE {table} MODIFY event_time DATETIME NOT NULL, "
+            "DROP PRIMARY KEY, ADD PRIMARY KEY (id, event_time)"
+        )
+        oldest = bind.execute(sa.text(
+            f"SELECT MIN(event_time) FROM {table} WHERE event_time > '{NO_TIME}'"
+        )).scalar() or date.today()
+        month = date(oldest.year, oldest.month, 1)
+        last = date.today().replace(day=1) + relativedelta(months=MONTHS_AHEAD)
+        parts = [f"PARTITION pold VALUES LESS THAN ('{month.isoformat()}')"]
+        while month <= last:
+            bound = month + relativedelta(months=1)
+            parts.append(f"PARTITION {month.strftime('p%Y%m')} VALUES LESS THAN ('{bound.isoformat()}')")
+            month = bound
+        parts.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        op.execute(
+            f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS(event_time) ({', '.join(parts)})"
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name not in ('mysql', 'mariadb'):
+        return
+    for table, references in (
+        ('applog', (('user_id', 'user'), ('product_id', 'inventory'))),
+        ('calibrationlog', (('user_id', 'user'), ('calibration_id', 'calibrations'))),
+    ):
+        if not partitioned(bind, table):
+            continue
+        op.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+        op.execute(
+            f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id), "
+            "MODIFY event_time DATETIME NULL"
+        )
+        for column, target in references:
+            op.create_foreign_key(None, table, target, [column], ['id'])
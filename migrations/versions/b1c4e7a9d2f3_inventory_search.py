@@ -0,0 +1,60 @@
+"""search index of the reagents
+
+Revision ID: b1c4e7a9d2f3
+Revises: a8d2f5c9e1b7
+Create Date: 2026-10-19 09:12:44.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.search import SEARCH_FIELDS, reagent_tokens
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c4e7a9d2f3'
+down_revision = 'a8d2f5c9e1b7'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    bind = op.get_bind()
+    # created by db.create_all() if the application already ran
+    if 'inventory_search' not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            'inventory_search',
+            sa.Column('token', sa.String(length=64), nullable=False),
+            sa.Column('inventory_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['inventory_id'], ['inventory.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('token', 'inventory_id'),
+        )
+        op.create_index(
+            op.f('ix_inventory_search_inventory_id'), 'inventory_search', ['inventory_id'], unique=False
+        )
+
+    # (re)built in any case, older tokens dropped the accented letters
+    search = sa.table('inventory_search', sa.column('token'), sa.column('inventory_id'))
+    inventory = sa.table('inventory', sa.column('id'), *(sa.column(f) for f in SEARCH_FIELDS))
+    bind.execute(search.delete())
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(inventory)
+            .where(inventory.c.id > last_id)
+            .order_by(inventory.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        values = [{'token': t, 'inventory_id': row.id} for row in rows for t in reagent_tokens(row)]
+        if values:
+            bind.execute(search.insert(), values)
+        last_id = rows[-1].id
+
+
+def downgrade():
+    op.drop_index(op.f('ix_inventory_search_inventory_id'), table_name='inventory_search')
+    op.drop_table('inventory_search')
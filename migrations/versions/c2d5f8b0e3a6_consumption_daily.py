@@ -0,0 +1,61 @@
+"""daily consumption rollup
+
+Revision ID: c2d5f8b0e3a6
+Revises: b1c4e7a9d2f3
+Create Date: 2026-10-19 09:40:17.281654
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d5f8b0e3a6'
+down_revision = 'b1c4e7a9d2f3'
+branch_labels = None
+depends_on = None
+
+# app.consumption.CONSUMPTION_EVENT
+CONSUMPTION_EVENT = 'updated'
+
+
+def upgrade():
+    bind = op.get_bind()
+    # created, and kept up to date, by the application if it already ran
+    if 'consumption_daily' in sa.inspect(bind).get_table_names():
+        return
+    op.create_table(
+        'consumption_daily',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('consumed', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['inventory.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id', 'day'),
+    )
+    op.create_index(op.f('ix_consumption_daily_day'), 'consumption_daily', ['day'], unique=False)
+
+    # backfill from the log rows of the reagents still in the inventory;
+    # rows already moved to the log archive are added by
+    # 'flask rebuild-consumption'
+    applog = sa.table(
+        'applog', sa.column('product_id'), sa.column('event_time'), sa.column('event_type')
+    )
+    inventory = sa.table('inventory', sa.column('id'))
+    rollup = sa.table(
+        'consumption_daily', sa.column('product_id'), sa.column('day'), sa.column('consumed')
+    )
+    day = sa.func.date(applog.c.event_time)
+    bind.execute(
+        rollup.insert().from_select(
+            ['product_id', 'day', 'consumed'],
+            sa.select(applog.c.product_id, day, sa.func.count())
+            .join(inventory, applog.c.product_id == inventory.c.id)
+            .where(applog.c.event_type == CONSUMPTION_EVENT, applog.c.event_time.is_not(None))
+            .group_by(applog.c.product_id, day),
+        )
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_consumption_daily_day'), table_name='consumption_daily')
+    op.drop_table('consumption_daily')
@@ -0,0 +1,32 @@
+"""data_version table
+
+Revision ID: c7e2f49a0b18
+Revises: 8b41e6d2a9c3
+Create Date: 2026-10-18 17:05:33.917240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2f49a0b18'
+down_revision = '8b41e6d2a9c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # created by db.create_all() if the application already ran
+    if 'data_version' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'data_version',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,29 @@
+"""time of the last change on data_version
+
+Revision ID: d4a8e1f7c2b6
+Revises: c7e2f49a0b18
+Create Date: 2026-10-18 19:12:48.305117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8e1f7c2b6'
+down_revision = 'c7e2f49a0b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # tables created by db.create_all() after this revision already have it
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('data_version')}
+    if 'changed_at' not in columns:
+        with op.batch_alter_table('data_version', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('changed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('data_version', schema=None) as batch_op:
+        batch_op.drop_column('changed_at')
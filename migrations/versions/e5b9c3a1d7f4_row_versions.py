@@ -0,0 +1,36 @@
+"""row version of inventory and calibrations
+
+Revision ID: e5b9c3a1d7f4
+Revises: d4a8e1f7c2b6
+Create Date: 2026-10-18 20:31:05.662410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9c3a1d7f4'
+down_revision = 'd4a8e1f7c2b6'
+branch_labels = None
+depends_on = None
+
+TABLES = ('inventory', 'calibrations')
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in TABLES:
+        # tables created by db.create_all() after this revision already have it
+        if 'version' in {c['name'] for c in inspector.get_columns(table)}:
+            continue
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column('version', sa.Integer(), nullable=False, server_default='0')
+            )
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version')
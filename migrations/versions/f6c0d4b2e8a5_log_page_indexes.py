@@ -0,0 +1,44 @@
+"""indexes of the log pages
+
+Revision ID: f6c0d4b2e8a5
+Revises: e5b9c3a1d7f4
+Create Date: 2026-10-18 21:47:19.208735
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c0d4b2e8a5'
+down_revision = 'e5b9c3a1d7f4'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'applog': {
+        'ix_applog_event_time_id': ['event_time', 'id'],
+        'ix_applog_user_id_event_time': ['user_id', 'event_time'],
+    },
+    'calibrationlog': {
+        'ix_calibrationlog_event_time_id': ['event_time', 'id'],
+        'ix_calibrationlog_calibration_id_event_time': ['calibration_id', 'event_time'],
+        'ix_calibrationlog_user_id_event_time': ['user_id', 'event_time'],
+    },
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table, indexes in INDEXES.items():
+        # created by db.create_all() if the tables are newer than this revision
+        existing = {i['name'] for i in inspector.get_indexes(table)}
+        for name, columns in indexes.items():
+            if name not in existing:
+                op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for table, indexes in INDEXES.items():
+        for name in indexes:
+            op.drop_index(name, table_name=table)
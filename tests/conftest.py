@@ -0,0 +1,112 @@
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask_security import hash_password
+
+from app import create_app, db
+from app.commands import ROLES
+from app.config import Config
+from app.models import Applog, Calibrations, Departments, Inventory, Locations, Role
+
+EMAIL = "tester@example.com"
+PASSWORD = "password"
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        WTF_CSRF_ENABLED = False
+        AUDIT_ASYNC = False
+        PAGE_CACHE = None
+        SERVER_TIMING = True
+        METRICS = False
+        LOG_ARCHIVE_DIR = str(tmp_path / "log_archive")
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        datastore = app.security.datastore
+        for name, description in ROLES:
+            datastore.put(Role(name=name, description=description, permissions=name))
+        datastore.create_user(
+            email=EMAIL,
+            username="tester",
+            password=hash_password(PASSWORD),
+            roles=[name for name, _ in ROLES],
+            active=True,
+        )
+        db.session.add_all([
+            Departments(name="Quality control", short_name="QC"),
+            Departments(name="Virology", short_name="VL"),
+        ])
+        db.session.commit()
+    # no context is kept pushed: each request gets its own, as in production
+    return app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    response = client.post("/login", data={"email": EMAIL, "password": PASSWORD})
+    assert response.status_code == 302
+    return client
+
+
+def add_rows(app, count):
+    """add count locations, reagents (low, zero and ordered ones among
+    them), calibrations and consumption events, in every department"""
+    with app.app_context():
+        _add_rows(count)
+
+
+def _add_rows(count):
+    from app.consumption import rebuild_consumption
+
+    departments = Departments.query.order_by(Departments.id).all()
+    start = Locations.query.count()
+    for i in range(start, start + count):
+        department = departments[i % len(departments)]
+        location = Locations(name=f"Location {i}", short_name=f"L{i}", department=department)
+        reagent = Inventory(
+            name=f"Reagent {i}",
+            location=location,
+            size="100 ml",
+            amount=i % 3,
+            amount2=0,
+            amount_limit=2,
+            order=i % 2,
+        )
+        calibration = Calibrations(
+            name=f"Balance {i}",
+            apparatus=f"A{i}",
+            description="balance",
+            department=department,
+            initial_check_date=date.today() - timedelta(days=400),
+            frequency=1,
+            frequency_units="months",
+            tolerance=1,
+            tolerance_units="weeks",
+            last_calibration_date=date.today() - timedelta(days=20),
+            next_calibration_date=date.today() + timedelta(days=10),
+        )
+        db.session.add_all([location, reagent, calibration])
+        db.session.flush()
+        db.session.add(Applog(
+            product_id=reagent.id,
+            event_time=datetime.now() - timedelta(days=1),
+            event_type="updated",
+            quantity_delta=-1,
+            event_detail=f"updated itemid {reagent.id}",
+        ))
+    db.session.commit()
+    rebuild_consumption()
+    db.session.commit()
+
+
+def statements(response):
+    """the statement count of the Server-Timing header (app.diagnostics)"""
+    timing = response.headers["Server-Timing"]
+    return int(timing.split('desc="')[1].split(" ")[0])
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.archive import archive_logs, archived_logs, archived_rows, read_index, segment_rows
+from app.models import Applog
+
+
+def _add_logs(start, count, step):
+    db.session.add_all(
+        Applog(
+            event_time=start + i * step,
+            event_type="updated",
+            event_detail=f"row {i}",
+        )
+        for i in range(count)
+    )
+    db.session.commit()
+
+
+def _page_through(filters, length):
+    rows = []
+    cursor = None
+    while True:
+        page = archived_logs(Applog, filters, cursor, length)
+        rows += page
+        if len(page) < length:
+            return rows
+        cursor = (page[-1].event_time, page[-1].id)
+
+
+def test_archive_and_read_back(app):
+    old = datetime.now() - timedelta(days=800)
+    with app.app_context():
+        _add_logs(old, 300, timedelta(hours=7))
+        first = archive_logs(Applog, 365)
+        # logged late for a month archived by the first run
+        _add_logs(old, 5, timedelta(days=1))
+        second = archive_logs(Applog, 365)
+
+        assert first + second == 305
+        assert Applog.query.filter(Applog.event_time < old + timedelta(days=300)).count() == 0
+        segments = read_index(Applog)
+        assert sum(s["rows"] for s in segments) == 305
+        assert all(s["state"] == "done" for s in segments)
+        assert any(".1." in s["file"] for s in segments)
+
+        stored = list(archived_rows(Applog))
+        assert len(stored) == 305
+        newest_first = sorted(
+            ((r["event_time"], r["id"]) for r in stored), reverse=True
+        )
+        for segment in segments:
+            rows = list(segment_rows(Applog, segment))
+            assert segment["rows"] == len(rows)
+            assert segment["min_time"] == min(r["event_time"] for r in rows)
+            assert segment["max_time"] == max(r["event_time"] for r in rows)
+            assert segment["min_id"] == min(r["id"] for r in rows)
+            assert segment["max_id"] == max(r["id"] for r in rows)
+
+        paged = _page_through({}, 40)
+        assert [(r.event_time.isoformat(), r.id) for r in paged] == newest_first
+
+        day = (old + timedelta(days=10)).date()
+        one_day = _page_through({"from": day, "to": day}, 3)
+        assert [(r.event_time.isoformat(), r.id) for r in one_day] == [
+            key for key in newest_first if key[0][:10] == day.isoformat()
+        ]
@@ -0,0 +1,30 @@
+from app import db
+from app.audit import write_at_request_end
+from app.functions import add_log
+from app.models import Applog, Inventory
+
+from tests.conftest import add_rows
+
+
+def test_delete_is_logged_in_its_commit(app, client):
+    add_rows(app, 1)
+    with app.app_context():
+        reagent = Inventory.query.first()
+        reagent_id, name = reagent.id, reagent.name
+
+    response = client.get(f"/delete/{reagent_id}/")
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert db.session.get(Inventory, reagent_id) is None
+        log = Applog.query.filter_by(event_type="deleted").one()
+        assert log.event_detail == f"deleted item {reagent_id} - {name}"
+
+
+def test_rollback_drops_the_logged_rows(app):
+    with app.test_request_context():
+        Inventory.query.all()
+        add_log(None, None, "never committed", event_type="deleted")
+        db.session.rollback()
+        write_at_request_end(None)
+        assert Applog.query.filter_by(event_type="deleted").count() == 0
@@ -0,0 +1,82 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from app import db
+from app.functions import calculate_relativedelta, next_calibration_date
+from app.models import Calibrations
+
+from tests.conftest import add_rows
+
+UNITS = ("days", "weeks", "months", "years")
+
+
+def loop_next_calibration_date(initial, frequency, frequency_units, last, tolerance, tolerance_units):
+    """the schedule walk next_calibration_date replaced, one step at a time"""
+    threshold = calculate_relativedelta(last, tolerance_units, tolerance, n=1)
+    n = 0
+    while True:
+        n += 1
+        nextc = calculate_relativedelta(initial, frequency_units, frequency, n)
+        if nextc > threshold:
+            return nextc
+
+
+def random_date(rng):
+    # month ends and leap days come up often enough to matter
+    if rng.random() < 0.3:
+        month_start = date(rng.randint(2000, 2030), rng.randint(1, 12), 1)
+        return month_start + relativedelta(months=1) - timedelta(days=rng.randint(1, 3))
+    return date(2000, 1, 1) + timedelta(days=rng.randint(0, 365 * 30))
+
+
+def test_same_dates_as_the_loop():
+    rng = random.Random(20261018)
+    for _ in range(5000):
+        initial = random_date(rng)
+        # last calibration before, on and after the initial check
+        last = initial + timedelta(days=rng.randint(-400, 365 * 8))
+        frequency_units = rng.choice(UNITS)
+        frequency = rng.randint(1, 4 if frequency_units == "years" else 40)
+        tolerance_units = rng.choice(UNITS)
+        tolerance = rng.randint(0, 3 if tolerance_units == "years" else 20)
+        args = (initial, frequency, frequency_units, last, tolerance, tolerance_units)
+        assert next_calibration_date(*args) == loop_next_calibration_date(*args), args
+
+
+def test_dates_as_strings():
+    assert next_calibration_date("2024-01-31", "1", "months", "2024-02-10", "1", "weeks") == date(2024, 2, 29)
+
+
+@pytest.mark.parametrize("frequency", [0, -1])
+def test_frequency_must_be_positive(frequency):
+    with pytest.raises(ValueError):
+        next_calibration_date(date(2024, 1, 1), frequency, "days", date(2024, 1, 1), 0, "days")
+
+
+def test_views_reject_a_frequency_below_one(app, client):
+    add_rows(app, 1)
+    data = {
+        "name": "Balance",
+        "apparatus": "A",
+        "description": "balance",
+        "department": "1",
+        "initial_check_date": "2024-01-01",
+        "frequency": "-1",
+        "frequency_units": "days",
+        "tolerance": "1",
+        "tolerance_units": "days",
+        "last_calibration_date": "2024-02-01",
+        "notes": "",
+    }
+    response = client.post("/edit_calibration/1/", data=data)
+    assert response.status_code == 200
+
+    response = client.post("/create_calibration", data={**data, "frequency": "0"})
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert Calibrations.query.filter_by(name="Balance").count() == 0
+        assert db.session.get(Calibrations, 1).frequency == 1
@@ -0,0 +1,24 @@
+from app import db
+from app.models import ConsumptionDaily, Inventory
+
+from tests.conftest import add_rows
+
+
+def test_delete_drops_the_rollup_of_the_reagent(app, client):
+    add_rows(app, 2)
+    with app.app_context():
+        first, second = (r.id for r in Inventory.query.order_by(Inventory.id).limit(2))
+        assert ConsumptionDaily.query.filter_by(product_id=second).count() == 1
+
+    assert client.get(f"/delete/{second}/").status_code == 302
+
+    with app.app_context():
+        assert db.session.get(Inventory, second) is None
+        assert ConsumptionDaily.query.filter_by(product_id=second).count() == 0
+        assert ConsumptionDaily.query.filter_by(product_id=first).count() == 1
+        # SQLite hands the highest id out again, the new reagent starts clean
+        reagent = Inventory(name="New reagent", location_id=1)
+        db.session.add(reagent)
+        db.session.commit()
+        assert reagent.id == second
+        assert ConsumptionDaily.query.filter_by(product_id=reagent.id).count() == 0
@@ -0,0 +1,31 @@
+from flask_security import hash_password
+
+from app import db
+from tests.conftest import EMAIL, PASSWORD
+
+
+def test_server_timing_goes_to_superadmins_only(app):
+    with app.app_context():
+        app.security.datastore.create_user(
+            email="admin@example.com",
+            username="admin",
+            password=hash_password(PASSWORD),
+            roles=["admin"],
+            active=True,
+        )
+        db.session.commit()
+    app.config["SERVER_TIMING"] = False
+
+    client = app.test_client()
+    assert "Server-Timing" not in client.get("/login").headers
+    assert client.post("/login", data={"email": "admin@example.com", "password": PASSWORD}).status_code == 302
+    response = client.get("/list_locations")
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+    client = app.test_client()
+    client.post("/login", data={"email": EMAIL, "password": PASSWORD})
+    assert "Server-Timing" in client.get("/list_locations").headers
+
+    app.config["SERVER_TIMING"] = True
+    assert "Server-Timing" in app.test_client().get("/login").headers
@@ -0,0 +1,25 @@
+from app import db
+from app.fragments import render_rows
+from app.models import Inventory
+
+from tests.conftest import add_rows
+
+
+def test_reused_id_is_not_served_the_deleted_row(app):
+    add_rows(app, 1)
+    with app.test_request_context():
+        old = Inventory(name="Deleted reagent", location_id=1)
+        db.session.add(old)
+        db.session.commit()
+        reused_id, version = old.id, old.version
+        assert "Deleted reagent" in render_rows("row_reagent.html", [old], "reagent")
+
+        db.session.delete(old)
+        db.session.commit()
+        new = Inventory(name="New reagent", location_id=1)
+        db.session.add(new)
+        db.session.commit()
+        # SQLite gives the highest id again
+        assert new.id == reused_id and new.version == version
+
+        assert "New reagent" in render_rows("row_reagent.html", [new], "reagent")
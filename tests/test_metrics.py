@@ -0,0 +1,30 @@
+import pytest
+
+from app import create_app
+from app.config import Config
+
+pytest.importorskip("prometheus_client")
+
+
+def metrics_app(tmp_path, token):
+    class MetricsConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        METRICS = True
+        METRICS_TOKEN = token
+
+    return create_app(MetricsConfig)
+
+
+def test_no_metrics_without_a_token(tmp_path):
+    client = metrics_app(tmp_path, None).test_client()
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_need_the_token(tmp_path):
+    client = metrics_app(tmp_path, "secret").test_client()
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert b"reagentario_requests_total" in response.data
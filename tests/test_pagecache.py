@@ -0,0 +1,98 @@
+import re
+import sys
+
+from flask import flash, render_template_string
+from sqlalchemy import event
+
+from app import db
+from app.pagecache import cached_page, page_store
+
+from tests.conftest import add_rows
+
+# a url of every view cached by app.pagecache
+URLS = {
+    "reagent.list": "/list",
+    "reagent.show": "/show/1/",
+    "reagent.show_log": "/show_log/1/",
+    "reagent.view_orders": "/view_orders/",
+    "reagent.view_low_quantity": "/view_low_quantity/",
+    "reagent.view_zero_quantity": "/view_zero_quantity/",
+    "reagent.stats": "/stats",
+    "calibration.list_calibrations": "/list_calibrations",
+    "calibration.list_calibrations_next_month": "/list_calibrations_next_month",
+    "calibration.list_calibrations_this_month": "/list_calibrations_this_month",
+    "calibration.list_calibrations_expiring": "/list_calibrations_expiring",
+    "calibration.list_calibrations_due": "/list_calibrations_due",
+    "calibration.list_calibrations_overdue": "/list_calibrations_overdue",
+    "calibration.show_calibration": "/show_calibration/1/",
+    "calibration.show_calibration_log": "/show_calibration_log/1/",
+    "location.list_locations": "/list_locations",
+    "location.list_location_content": "/list_location_content/1/",
+    "department.list_departments": "/list_departments",
+}
+
+# part of the key of every page: the roles of the user and the versions
+KEYED = {"data_version", "role", "roles_users"}
+
+_table = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)', re.IGNORECASE)
+
+
+def _view(function):
+    while hasattr(function, "__wrapped__"):
+        function = function.__wrapped__
+    return function
+
+
+def test_declared_tables_cover_the_statements(app, client):
+    add_rows(app, 3)
+    cached = {
+        endpoint: function
+        for endpoint, function in app.view_functions.items()
+        if hasattr(function, "page_tables")
+    }
+    assert set(cached) == set(URLS)
+
+    read = set()
+    running = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # only the statements run by the view itself, not by the login
+        # and page cache code around it
+        frame = sys._getframe()
+        while frame is not None:
+            if frame.f_code is running[0]:
+                read.update(_table.findall(statement))
+                return
+            frame = frame.f_back
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for endpoint, url in URLS.items():
+            read.clear()
+            running[:] = [_view(cached[endpoint]).__code__]
+            assert client.get(url).status_code == 200, url
+            missing = read - set(cached[endpoint].page_tables) - KEYED
+            assert not missing, f"{endpoint} reads {sorted(missing)}"
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def test_pages_flashing_a_message_are_not_cached(app):
+    app.config["PAGE_CACHE"] = "memory"
+    messages = iter(["first", "second"])
+
+    @app.route("/flashing")
+    @cached_page("departments")
+    def flashing():
+        flash(next(messages))
+        return render_template_string("{{ get_flashed_messages()|join }}")
+
+    client = app.test_client()
+    assert client.get("/flashing").text == "first"
+    second = client.get("/flashing")
+    assert second.text == "second"
+    assert "ETag" not in second.headers
+    with app.app_context():
+        assert not page_store().items
@@ -0,0 +1,27 @@
+from app import db
+from app.models import Inventory
+from app.search import index_reagent, search, tokenize
+
+
+def test_tokens_are_folded():
+    assert tokenize("Acétone pür_Grade") == {"acetone", "pur", "grade", "acetone pur_grade"}
+    assert "οξυ" in tokenize("Υδροχλωρικό οξύ")
+
+
+def test_search(app):
+    with app.app_context():
+        for name in ("Acétone", "Υδροχλωρικό οξύ", "Ethanol"):
+            reagent = Inventory(name=name)
+            db.session.add(reagent)
+            db.session.flush()
+            index_reagent(reagent)
+        db.session.commit()
+
+        def found(text):
+            return sorted(r.name for r in search(Inventory.query, text))
+
+        assert found("acetone") == ["Acétone"]
+        assert found("ACÉT") == ["Acétone"]
+        assert found("οξυ") == ["Υδροχλωρικό οξύ"]
+        assert found("--") == []
+        assert len(found("  ")) == 3
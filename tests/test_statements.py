@@ -0,0 +1,34 @@
+import pytest
+
+from app.models import Locations
+from tests.conftest import add_rows, statements
+
+# the views below read all their rows with a fixed number of statements,
+# whatever the number of rows: an N+1 query makes the count grow
+
+ROUTES = [
+    "/list",
+    "/list_location_content/{location}/",
+    "/list_data?draw=1&start=0&length=200",
+    "/view_orders/",
+    "/view_low_quantity/",
+    "/view_zero_quantity/",
+    "/stats",
+    "/list_calibrations",
+]
+
+
+def _count(app, client, route):
+    with app.app_context():
+        location = Locations.query.order_by(Locations.id).first().id
+    response = client.get(route.format(location=location))
+    assert response.status_code == 200
+    return statements(response)
+
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_statements_do_not_grow_with_rows(app, client, route):
+    add_rows(app, 4)
+    few = _count(app, client, route)
+    add_rows(app, 40)
+    assert _count(app, client, route) == few
@@ -0,0 +1,52 @@
+import threading
+
+from app import db
+from app.functions import update_stock
+from app.models import Applog, Inventory
+
+THREADS = 12
+CLICKS = 5
+STOCK = 40
+
+
+def test_concurrent_removals_never_go_below_zero(app):
+    with app.app_context():
+        reagent = Inventory(name="Ethanol", amount=STOCK)
+        db.session.add(reagent)
+        db.session.commit()
+        reagent_id = reagent.id
+
+    start = threading.Barrier(THREADS)
+    done = []
+    errors = []
+
+    def remove():
+        start.wait()
+        for _ in range(CLICKS):
+            with app.app_context():
+                try:
+                    done.append(update_stock(
+                        reagent_id,
+                        None,
+                        {Inventory.amount: Inventory.amount - 1},
+                        [Inventory.amount > 0],
+                        f"removed itemid {reagent_id}",
+                        event_type="removed",
+                        quantity_delta=-1,
+                    ))
+                except Exception as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=remove) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # 60 clicks on 40 units: 40 applied, 20 refused, none lost
+    assert done.count(True) == STOCK
+    assert done.count(False) == THREADS * CLICKS - STOCK
+    with app.app_context():
+        assert db.session.get(Inventory, reagent_id).amount == 0
+        assert Applog.query.filter_by(product_id=reagent_id, event_type="removed").count() == STOCK